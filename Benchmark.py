@@ -0,0 +1,834 @@
+#!/bin/env python3
+
+'''
+Benchmarks for the folder creation and copy paths of HistoryBackend.py.
+
+DIR is pointed at a temporary folder, optionally with a delay added to every call that touches it to act like a
+share over SMB. Synthetic workloads are timed and the results are printed as JSON so two versions can be diffed.
+
+Example:
+    python Benchmark.py --latency 0.005 --output before.json
+    python Benchmark.py --workloads tiny,tools --large-size 2048
+    python Benchmark.py --workloads stress --uploaders 16
+    python Benchmark.py --workloads s3 --large-size 64
+    python Benchmark.py --workloads memory --huge-size 2048 --huge-count 4
+'''
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import socket
+import logging
+import argparse
+import platform
+import tempfile
+import builtins
+import threading
+import multiprocessing
+from datetime import datetime
+
+import HistoryBackend as ph
+
+WORKLOADS = ("tiny", "large", "deep", "tools")
+# Not run by default. stress checks correctness more than it measures speed, s3 needs boto3 and moto[server] (or an
+# object store given with --s3-endpoint), memory writes --huge-count files of --huge-size MB twice
+EXTRA_WORKLOADS = ("stress", "s3", "memory")
+
+# Names left behind on the share by an upload that did not finish cleanly
+TEMP_NAME = re.compile(r"\.(part|link|clone|tmp|journal|lock)$")
+
+#############################################################
+# Latency
+#############################################################
+class LatencyInjector:
+    '''
+    Adds a fixed delay to every filesystem call on a path under the share folder while it is active
+
+    Args:
+        share (str): The folder that acts like the share
+        latency (float): Seconds added to each call
+
+    Returns:
+        None
+    '''
+    CALLS = ("mkdir", "stat", "scandir", "listdir", "replace", "rename", "link", "remove", "utime", "chmod")
+
+    def __init__(self, share, latency):
+        self.share = os.path.abspath(share)
+        self.latency = latency
+        self.originals = {}
+        self.calls = 0
+
+    def onShare(self, path):
+        '''
+        Checks if a path is on the share
+
+        Args:
+            path (str): The path, anything that is not a path is treated as local
+
+        Returns:
+            bool: True if the path is under the share folder
+        '''
+        if (isinstance(path, int)):
+            return False
+        try:
+            return os.path.abspath(os.fspath(path)).startswith(self.share)
+        except TypeError:
+            return False
+
+    def wrap(self, function):
+        '''
+        Wraps a function so that calls on share paths are delayed
+
+        Args:
+            function (function): The original function
+
+        Returns:
+            function: The delayed function
+        '''
+        def delayed(path, *args, **kwargs):
+            if (self.onShare(path)):
+                self.calls += 1
+                time.sleep(self.latency)
+            return function(path, *args, **kwargs)
+        return delayed
+
+    def __enter__(self):
+        if (not self.latency):
+            return self
+        for name in self.CALLS:
+            self.originals[name] = getattr(os, name)
+            setattr(os, name, self.wrap(self.originals[name]))
+        # HistoryBackend opens its files through the builtin, a module global takes its place
+        ph.open = self.wrap(builtins.open)
+        return self
+
+    def __exit__(self, *exc):
+        for name, function in self.originals.items():
+            setattr(os, name, function)
+        self.originals = {}
+        if (hasattr(ph, "open")):
+            del ph.open
+
+#############################################################
+# Workloads
+#############################################################
+def configure(root, share, metrics = "metrics.db"):
+    '''
+    Points HistoryBackend at the benchmark folders instead of the real share
+
+    Args:
+        root (str): The benchmark folder, the index and metrics go here
+        share (str): The folder used as DIR
+        metrics (str): The metrics file name in root
+
+    Returns:
+        None
+    '''
+    logging.getLogger(ph.LOG_NAME).setLevel(logging.WARNING)
+    ph.DIR = share
+    ph.DIR_CACHE = ph.DirCache(None)
+    ph.INDEX = ph.HistoryIndex(os.path.join(root, "history.db"))
+    ph.METRICS = ph.Metrics(os.path.join(root, metrics))
+
+def makeFiles(folder, count, size):
+    '''
+    Writes files of random bytes to use as uploads
+
+    Args:
+        folder (str): Where the files are written
+        count (int): The number of files
+        size (int): The size of each file in bytes
+
+    Returns:
+        list: The file paths
+    '''
+    os.makedirs(folder, exist_ok = True)
+    paths = []
+    block = os.urandom(min(size, 1024 * 1024))
+    for number in range(count):
+        path = os.path.join(folder, f"file_{number:05}.bin")
+        with open(path, "wb") as file:
+            remaining = size
+            while remaining > 0:
+                file.write(block[:remaining])
+                remaining -= len(block)
+        paths.append(path)
+    return paths
+
+def resetShare(share):
+    '''
+    Empties the share folder and every cache that remembers it, and makes a new empty history index
+
+    Args:
+        share (str): The share folder
+
+    Returns:
+        None
+    '''
+    shutil.rmtree(share, ignore_errors = True)
+    os.makedirs(share)
+    ph.DIR_CACHE = ph.DirCache(None)
+    if (os.path.exists(ph.INDEX.path)):
+        os.remove(ph.INDEX.path)
+    ph.INDEX = ph.HistoryIndex(ph.INDEX.path)
+    # The tables are made now, not by the first upload inside a timed run
+    with ph.INDEX.transaction():
+        pass
+
+def prepareUpload(tool, work_order):
+    '''
+    Makes the folders an upload copies into
+
+    Args:
+        tool (str): The tool number
+        work_order (str): The work order number
+
+    Returns:
+        None
+    '''
+    ph.createFolderStructure(tool, work_order)
+    os.makedirs(ph.uploadFolders(tool, work_order)[1], exist_ok = True)
+
+def timeRun(share, latency, function):
+    '''
+    Times one run with latency injected
+
+    Args:
+        share (str): The share folder
+        latency (float): Seconds added to each share call
+        function (function): Runs the work and returns (files, bytes, counter)
+
+    Returns:
+        dict: seconds, files, bytes, MB/s, counted calls and delayed calls
+    '''
+    with LatencyInjector(share, latency) as injector:
+        start = time.perf_counter()
+        files, size, counter = function()
+        seconds = time.perf_counter() - start
+    return {
+        "seconds": round(seconds, 4),
+        "files": files,
+        "bytes": size,
+        "mb_per_s": round(size / seconds / (1024 * 1024), 2) if size and seconds else None,
+        "fs_calls": counter.total() if counter else None,
+        "share_calls": injector.calls if latency else None
+    }
+
+def copyStrategies(paths, workers):
+    '''
+    Gets the copy strategies compared by the copy workloads
+
+    Args:
+        paths (list): The files being uploaded
+        workers (int): The most copies run at the same time
+
+    Returns:
+        list: (name, function) where function(tool, work_order) uploads paths and returns (files, bytes, counter)
+    '''
+    size = sum(os.path.getsize(path) for path in paths)
+
+    def serialCopy2(tool, work_order):
+        # The way uploads were copied before the copy engine, kept as the baseline
+        wo_folder = ph.uploadFolders(tool, work_order)[1]
+        for path in paths:
+            shutil.copy2(path, os.path.join(wo_folder, os.path.basename(path)))
+        return len(paths), size, None
+
+    def engine(count, dedup = False):
+        def run(tool, work_order):
+            counter = ph.FsCounter()
+            errors = ph.uploadFiles(tool, work_order, 1, paths, [], ph.CopyEngine(workers = count, dedup = dedup), counter)
+            if (errors):
+                raise RuntimeError(f"{len(errors)} copies failed: {errors[0]}")
+            return len(paths), size, counter
+        return run
+
+    strategies = [("serial_copy2", serialCopy2), ("engine_1", engine(1))]
+    if (workers > 1):
+        strategies.append((f"engine_{workers}", engine(workers)))
+    strategies.append((f"engine_{workers}_dedup_repeat", engine(workers, dedup = True)))
+    return strategies
+
+def benchCopies(name, share, source, latency, workers, count, size):
+    '''
+    Times every copy strategy on one set of files
+
+    Args:
+        name (str): The workload name
+        share (str): The share folder
+        source (str): Where the synthetic files are written
+        latency (float): Seconds added to each share call
+        workers (int): The most copies run at the same time
+        count (int): The number of files
+        size (int): The size of each file in bytes
+
+    Returns:
+        list: The results
+    '''
+    paths = makeFiles(os.path.join(source, name), count, size)
+    results = []
+    for strategy, function in copyStrategies(paths, workers):
+        resetShare(share)
+        prepareUpload("10000", "00000001")
+        if (strategy.endswith("_dedup_repeat")):
+            # Dedup only pays off on a repeat, so the same files are uploaded once before the timed run
+            function("10000", "00000001")
+            prepareUpload("10000", "00000002")
+            result = timeRun(share, latency, lambda: function("10000", "00000002"))
+        else:
+            result = timeRun(share, latency, lambda: function("10000", "00000001"))
+        results.append({"workload": name, "strategy": strategy, **result})
+    shutil.rmtree(os.path.join(source, name))
+    return results
+
+def benchDeep(share, latency, work_orders):
+    '''
+    Times createFolderStructure on a tool that already has many work orders, with a cold and a warm folder cache
+
+    Args:
+        share (str): The share folder
+        latency (float): Seconds added to each share call
+        work_orders (int): The number of existing work orders
+
+    Returns:
+        list: The results
+    '''
+    resetShare(share)
+    for number in range(work_orders):
+        prepareUpload("20000", f"{number:08}")
+
+    def create(work_order):
+        def run():
+            counter = ph.FsCounter()
+            ph.createFolderStructure("20000", work_order, counter)
+            return 0, 0, counter
+        return run
+
+    results = []
+    ph.DIR_CACHE = ph.DirCache(None)
+    results.append({"workload": "deep", "strategy": "existing_wo_cold_cache", **timeRun(share, latency, create("00000000"))})
+    results.append({"workload": "deep", "strategy": "existing_wo_warm_cache", **timeRun(share, latency, create("00000000"))})
+    results.append({"workload": "deep", "strategy": "new_wo_warm_cache", **timeRun(share, latency, create("99999999"))})
+    return results
+
+def benchTools(share, latency, tools):
+    '''
+    Times createFolderStructure for many new tools, then again for the same tools once they exist
+
+    Args:
+        share (str): The share folder
+        latency (float): Seconds added to each share call
+        tools (int): The number of tools
+
+    Returns:
+        list: The results
+    '''
+    resetShare(share)
+
+    def create():
+        counter = ph.FsCounter()
+        for number in range(tools):
+            ph.createFolderStructure(f"{30000 + number}", "00000001", counter)
+        return 0, 0, counter
+
+    results = [{"workload": "tools", "strategy": "new_tools", **timeRun(share, latency, create)}]
+    ph.DIR_CACHE = ph.DirCache(None)
+    results.append({"workload": "tools", "strategy": "existing_tools_cold_cache", **timeRun(share, latency, create)})
+    results.append({"workload": "tools", "strategy": "existing_tools_warm_cache", **timeRun(share, latency, create)})
+    return results
+
+def stressUploader(root, share, latency, number, job, start, results):
+    '''
+    One uploader of the stress workload, runs in its own process
+
+    Args:
+        root (str): The benchmark folder
+        share (str): The share folder
+        latency (float): Seconds added to each share call
+        number (int): The uploader number
+        job (dict): tool, work_order, order_type, inside and outside for uploadJob
+        start (multiprocessing.Event): Set once every uploader is ready, so they all hit the share together
+        results (multiprocessing.Queue): Gets (number, errors)
+
+    Returns:
+        None
+    '''
+    configure(root, share, f"metrics_{number}.db")
+    start.wait()
+    errors = []
+    try:
+        with LatencyInjector(share, latency):
+            # The share was emptied first, so every uploader races to create the same new tool
+            errors = ph.uploadJob(
+                job["tool"], job["work_order"], job["order_type"], job["inside"], job["outside"],
+                ph.CopyEngine(workers = 4), user = f"uploader{number}"
+            )
+    except Exception as e:
+        errors = [(None, e)]
+    results.put((number, [f"{path}: {error!r}" for path, error in errors]))
+
+def checkStress(share, jobs, hashes):
+    '''
+    Checks the share after the stress workload: no temporary files left, every upload's content landed in the folder
+    it was sent to, identical content was stored once, and every file is in the work order manifest
+
+    Args:
+        share (str): The share folder
+        jobs (list): The jobs given to the uploaders
+        hashes (dict): Source path -> hash
+
+    Returns:
+        list: A description of every problem found
+    '''
+    problems = []
+    for folder, _, names in os.walk(share):
+        problems += [f"Temporary file left: {os.path.join(folder, name)}" for name in names if TEMP_NAME.search(name)]
+
+    tool, work_order = jobs[0]["tool"], jobs[0]["work_order"]
+    folder_dst, wo_folder_dst = ph.uploadFolders(tool, work_order)
+    stock = os.path.join(wo_folder_dst, f"STOCK ORDER_{datetime.now().strftime('%m.%d.%Y')}")
+
+    # What each folder holds, by the file name before any _vN version suffix
+    found = {}
+    for folder in (folder_dst, wo_folder_dst, stock):
+        for entry in os.scandir(folder):
+            if (entry.is_file() and entry.name != ph.MANIFEST_NAME):
+                name = re.sub(r"_v\d+(\.[^.]*)?$", r"\1", entry.name)
+                found.setdefault((folder, name), []).append(ph.hashFile(entry.path))
+
+    for (folder, name), file_hashes in found.items():
+        if (len(file_hashes) != len(set(file_hashes))):
+            problems.append(f"The same content of {name} is stored more than once in {folder}")
+
+    for job in jobs:
+        inside = stock if job["order_type"] == 3 else wo_folder_dst
+        for folder, paths in ((inside, job["inside"]), (folder_dst, job["outside"])):
+            for path in paths:
+                if (hashes[path] not in found.get((folder, os.path.basename(path)), [])):
+                    problems.append(f"{path} did not land in {folder}")
+
+    tool_path = os.path.join(share, tool)
+    manifest = {entry["path"]: entry["hash"] for entry in ph.readManifest(os.path.join(wo_folder_dst, ph.MANIFEST_NAME))}
+    for folder in (folder_dst, wo_folder_dst, stock):
+        for entry in os.scandir(folder):
+            if (entry.is_file() and entry.name != ph.MANIFEST_NAME):
+                path = os.path.relpath(entry.path, tool_path).replace(os.sep, "/")
+                if (manifest.get(path) != ph.hashFile(entry.path)):
+                    problems.append(f"{path} is missing from the manifest or has the wrong hash")
+    return problems
+
+def benchStress(root, share, source, latency, uploaders):
+    '''
+    Starts many uploaders in separate processes at the same moment, all writing to the same tool and work order,
+    then checks the result. Half of them upload stock orders. Every uploader sends a file with the same name and
+    content as the others, a file with the same name and different content, and a file of its own.
+
+    Args:
+        root (str): The benchmark folder
+        share (str): The share folder
+        source (str): Where the synthetic files are written
+        latency (float): Seconds added to each share call
+        uploaders (int): The number of uploader processes
+
+    Returns:
+        list: The result, with the problems found
+    '''
+    resetShare(share)
+    common = os.urandom(256 * 1024)
+    jobs = []
+    hashes = {}
+    for number in range(uploaders):
+        folder = os.path.join(source, "stress", str(number))
+        os.makedirs(folder)
+        contents = {
+            "inside": {"common.bin": common, "drawing.pdf": os.urandom(64 * 1024), f"own_{number}.bin": os.urandom(4096)},
+            "outside": {"model.step": os.urandom(32 * 1024)}
+        }
+        job = {"tool": "40000", "work_order": "00000001", "order_type": 3 if number % 2 else 1}
+        for side, files in contents.items():
+            job[side] = []
+            for name, data in files.items():
+                path = os.path.join(folder, name)
+                with open(path, "wb") as file:
+                    file.write(data)
+                hashes[path] = ph.hashFile(path)
+                job[side].append(path)
+        jobs.append(job)
+
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target = stressUploader, args = (root, share, latency, number, job, start, results))
+        for number, job in enumerate(jobs)
+    ]
+    for process in processes:
+        process.start()
+    began = time.perf_counter()
+    start.set()
+    errors = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    seconds = time.perf_counter() - began
+
+    problems = [f"Uploader {number}: {error}" for number, upload_errors in errors for error in upload_errors]
+    problems += checkStress(share, jobs, hashes)
+    size = sum(os.path.getsize(path) for path in hashes)
+    shutil.rmtree(os.path.join(source, "stress"))
+    return [{
+        "workload": "stress",
+        "strategy": f"{uploaders}_uploaders",
+        "seconds": round(seconds, 4),
+        "files": sum(len(job["inside"]) + len(job["outside"]) for job in jobs),
+        "bytes": size,
+        "ok": not problems,
+        "problems": problems
+    }]
+
+#############################################################
+# Memory
+#############################################################
+class RssSampler:
+    '''
+    Samples the resident memory of this process on a thread while active and keeps the peak. Reads /proc/self/statm,
+    so there are no numbers on systems without it.
+
+    Args:
+        interval (float): Seconds between samples
+
+    Returns:
+        None
+    '''
+    def __init__(self, interval = 0.005):
+        self.interval = interval
+        self.start = None
+        self.peak = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def rss(self):
+        '''
+        Gets the resident memory of this process
+
+        Args:
+            None
+
+        Returns:
+            int: Bytes, None if it cannot be read
+        '''
+        try:
+            with open("/proc/self/statm", encoding = "utf-8") as file:
+                return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def sample(self):
+        '''
+        Keeps sampling until the with block ends, runs on its own thread
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        while not self.stopped.wait(self.interval):
+            rss = self.rss()
+            if (rss is not None):
+                self.peak = max(self.peak or 0, rss)
+
+    def __enter__(self):
+        self.start = self.peak = self.rss()
+        self.thread = threading.Thread(target = self.sample, daemon = True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+    def results(self):
+        '''
+        Gets the numbers for the report
+
+        Args:
+            None
+
+        Returns:
+            dict: Peak resident memory and how much it grew over the start, in MB
+        '''
+        if (self.start is None):
+            return {"peak_rss_mb": None, "rss_growth_mb": None}
+        return {
+            "peak_rss_mb": round(self.peak / (1024 * 1024), 1),
+            "rss_growth_mb": round((self.peak - self.start) / (1024 * 1024), 1)
+        }
+
+def benchMemory(share, source, latency, workers, count, size):
+    '''
+    Copies one file of a quarter of size, one file of size, then count files of size at the same time, and records
+    the peak resident memory of each next to its speed. With pooled buffers the peak should not grow with the file
+    size or the number of copies. shutil.copy2 is timed as the baseline.
+
+    Args:
+        share (str): The share folder
+        source (str): Where the synthetic files are written
+        latency (float): Seconds added to each share call
+        workers (int): The most copies run at the same time
+        count (int): The number of huge files
+        size (int): The size of each huge file in bytes
+
+    Returns:
+        list: The results
+    '''
+    folder = os.path.join(source, "memory")
+    quarter = makeFiles(os.path.join(folder, "quarter"), 1, max(1, size // 4))
+    huge = makeFiles(os.path.join(folder, "huge"), count, size)
+
+    def copy2(paths):
+        def run():
+            wo_folder = ph.uploadFolders("50000", "00000001")[1]
+            for path in paths:
+                shutil.copy2(path, os.path.join(wo_folder, os.path.basename(path)))
+            return len(paths), sum(os.path.getsize(path) for path in paths), None
+        return run
+
+    def engine(paths):
+        def run():
+            counter = ph.FsCounter()
+            errors = ph.uploadFiles("50000", "00000001", 1, paths, [], ph.CopyEngine(workers = workers), counter)
+            if (errors):
+                raise RuntimeError(f"{len(errors)} copies failed: {errors[0]}")
+            return len(paths), sum(os.path.getsize(path) for path in paths), counter
+        return run
+
+    cases = [
+        ("serial_copy2_1_file", copy2(huge[:1])),
+        ("engine_1_quarter_file", engine(quarter)),
+        ("engine_1_file", engine(huge[:1])),
+        (f"engine_{workers}_{count}_files", engine(huge))
+    ]
+
+    results = []
+    try:
+        for strategy, function in cases:
+            resetShare(share)
+            prepareUpload("50000", "00000001")
+            # Every case starts with no buffers made and nothing learned, like a new process
+            ph.BUFFERS = ph.BufferPool()
+            ph.ChunkSizer.learned.clear()
+            with RssSampler() as sampler:
+                result = timeRun(share, latency, function)
+            results.append({"workload": "memory", "strategy": strategy, **result, **sampler.results()})
+    finally:
+        shutil.rmtree(folder)
+    return results
+
+#############################################################
+# Object Store
+#############################################################
+def startObjectStore():
+    '''
+    Starts a moto server on a free local port to stand in for an S3 compatible object store
+
+    Args:
+        None
+
+    Returns:
+        tuple: (endpoint url, server), both None when moto is not installed
+    '''
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        return None, None
+    # moto takes any credentials, boto3 only needs some to sign the requests with
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = ThreadedMotoServer(ip_address = "127.0.0.1", port = port, verbose = False)
+    server.start()
+    return f"http://127.0.0.1:{port}", server
+
+def benchS3(share, source, endpoint, latency, workers, count, large_count, large_size):
+    '''
+    Uploads small and large files to an object store, first one request per file one after the other, then through
+    the copy engine with S3Storage (parallel multipart uploads), then through the engine again when nothing changed,
+    which should send nothing. Every object is checked against the hash of its file afterwards.
+
+    Args:
+        share (str): The share folder, its paths become the object keys
+        source (str): Where the synthetic files are written
+        endpoint (str): The object store, None to start a local moto server
+        latency (float): Seconds added to each request, a local server answers much faster than a remote one
+        workers (int): The most files uploaded at the same time
+        count (int): The number of 64 KB files
+        large_count (int): The number of large files
+        large_size (int): The size of each large file in bytes
+
+    Returns:
+        list: One result per strategy
+    '''
+    server = None
+    if (endpoint is None):
+        endpoint, server = startObjectStore()
+        if (endpoint is None):
+            return [{"workload": "s3", "strategy": None, "ok": False, "problems": ["Needs moto[server] or --s3-endpoint"]}]
+
+    resetShare(share)
+    previous = ph.STORAGE
+    storage = ph.S3Storage("ph-benchmark", f"benchmark-{os.getpid()}-{int(time.time())}/", endpoint)
+    results = []
+    try:
+        client = storage.connect()
+        try:
+            client.create_bucket(Bucket = storage.bucket)
+        except Exception as e:
+            if (ph.s3ErrorCode(e) not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists")):
+                raise
+        ph.STORAGE = storage
+        if (latency):
+            client.meta.events.register("before-send.s3", lambda **kwargs: time.sleep(latency))
+
+        # The large files are outside files so their names do not clash with the small ones
+        small = makeFiles(os.path.join(source, "s3", "small"), count, 64 * 1024)
+        large = makeFiles(os.path.join(source, "s3", "large"), large_count, large_size)
+        paths = small + large
+        size = sum(os.path.getsize(path) for path in paths)
+        jobs = ph.planUpload("40000", "00000002", 1, small, large)
+
+        def serialPut():
+            # One request per file one after the other, the way a plain copy loop would upload
+            for path, dst in ph.planUpload("40001", "00000001", 1, small, large):
+                with open(path, "rb") as file:
+                    body = file.read()
+                client.put_object(Bucket = storage.bucket, Key = storage.key(dst), Body = body)
+            return len(paths), size, None
+
+        actions = {}
+        def engine(name):
+            def run():
+                counter = ph.FsCounter()
+                ph.createFolderStructure("40000", "00000002", counter)
+                copied, errors = ph.CopyEngine(workers = workers).run(jobs, counter)
+                if (errors):
+                    raise RuntimeError(f"{len(errors)} uploads failed: {errors[0]}")
+                actions[name] = [result.action for result in copied]
+                return len(paths), size, counter
+            return run
+
+        for name, function in (("s3_serial_put", serialPut), (f"s3_engine_{workers}", engine("first")),
+                               (f"s3_engine_{workers}_unchanged", engine("again"))):
+            results.append({"workload": "s3", "strategy": name, **timeRun(share, 0, function)})
+
+        problems = [f"{actions['again'].count('copied')} unchanged file(s) were sent again"] if "copied" in actions["again"] else []
+        for path, dst in jobs:
+            head = storage.head(storage.key(dst))
+            if (head is None or head.get("Metadata", {}).get(ph.HASH_ALGORITHM) != ph.hashFile(path)):
+                problems.append(f"{os.path.basename(path)} is missing or different in the object store")
+        results[-1].update({"ok": not problems, "problems": problems})
+    finally:
+        ph.STORAGE = previous
+        shutil.rmtree(os.path.join(source, "s3"), ignore_errors = True)
+        if (storage.client):
+            paginator = storage.client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket = storage.bucket, Prefix = storage.prefix):
+                keys = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+                if (keys):
+                    storage.client.delete_objects(Bucket = storage.bucket, Delete = {"Objects": keys})
+        if (server):
+            server.stop()
+    return results
+
+#############################################################
+# If Main
+#############################################################
+def main(argv = None):
+    '''
+    Runs the chosen workloads and prints or saves the results
+
+    Args:
+        argv (list): The command line arguments, defaults to sys.argv
+
+    Returns:
+        int: The exit code
+    '''
+    parser = argparse.ArgumentParser(description = "Benchmark the Production History folder creation and copy paths")
+    parser.add_argument(
+        "--workloads", default = ",".join(WORKLOADS),
+        help = f"Comma separated, from {', '.join(WORKLOADS + EXTRA_WORKLOADS)}"
+    )
+    parser.add_argument("--latency", type = float, default = 0.0, help = "Seconds added to every call on the share")
+    parser.add_argument("--workers", type = int, default = ph.UPLOAD_WORKERS, help = "Most copies run at the same time")
+    parser.add_argument("--tiny-count", type = int, default = 500, help = "Number of files in the tiny workload")
+    parser.add_argument("--large-count", type = int, default = 2, help = "Number of files in the large workload")
+    parser.add_argument("--large-size", type = int, default = 256, help = "Size in MB of each large file")
+    parser.add_argument("--work-orders", type = int, default = 200, help = "Existing work orders in the deep workload")
+    parser.add_argument("--tools", type = int, default = 1000, help = "Number of tools in the tools workload")
+    parser.add_argument("--uploaders", type = int, default = 16, help = "Number of uploader processes in the stress workload")
+    parser.add_argument("--huge-count", type = int, default = 4, help = "Number of files copied at once in the memory workload")
+    parser.add_argument("--huge-size", type = int, default = 512, help = "Size in MB of each file in the memory workload")
+    parser.add_argument("--s3-endpoint", help = "Object store for the s3 workload instead of a local moto server")
+    parser.add_argument("--root", help = "Folder to run in instead of a new temporary folder")
+    parser.add_argument("--output", help = "Write the JSON results to this file instead of printing them")
+    args = parser.parse_args(argv)
+
+    workloads = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    unknown = set(workloads) - set(WORKLOADS + EXTRA_WORKLOADS)
+    if (unknown):
+        parser.error(f"Unknown workloads: {', '.join(sorted(unknown))}")
+
+    root = args.root or tempfile.mkdtemp(prefix = "ph_bench_")
+    share = os.path.join(root, "share")
+    source = os.path.join(root, "source")
+    os.makedirs(share, exist_ok = True)
+    configure(root, share)
+
+    results = []
+    try:
+        for workload in workloads:
+            print(f"Running {workload}", file = sys.stderr)
+            if (workload == "tiny"):
+                results += benchCopies("tiny", share, source, args.latency, args.workers, args.tiny_count, 4 * 1024)
+            elif (workload == "large"):
+                size = args.large_size * 1024 * 1024
+                results += benchCopies("large", share, source, args.latency, args.workers, args.large_count, size)
+            elif (workload == "deep"):
+                results += benchDeep(share, args.latency, args.work_orders)
+            elif (workload == "tools"):
+                results += benchTools(share, args.latency, args.tools)
+            elif (workload == "stress"):
+                results += benchStress(root, share, source, args.latency, args.uploaders)
+            elif (workload == "memory"):
+                size = args.huge_size * 1024 * 1024
+                results += benchMemory(share, source, args.latency, args.workers, args.huge_count, size)
+            elif (workload == "s3"):
+                size = args.large_size * 1024 * 1024
+                results += benchS3(share, source, args.s3_endpoint, args.latency, args.workers, args.tiny_count, args.large_count, size)
+    finally:
+        if (not args.root):
+            shutil.rmtree(root, ignore_errors = True)
+
+    report = {
+        "version": ph.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "latency": args.latency,
+        "workers": args.workers,
+        "results": results
+    }
+    text = json.dumps(report, indent = 4)
+    if (args.output):
+        with open(args.output, "w", encoding = "utf-8") as file:
+            file.write(text)
+    else:
+        print(text)
+    return 0 if all(result.get("ok", True) for result in results) else 1
+
+if (__name__ == "__main__"):
+    sys.exit(main())
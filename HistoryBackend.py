@@ -0,0 +1,4402 @@
+#!/bin/env python3
+
+'''
+Everything the production history upload does apart from the window: folder creation, copying, validation, the
+history index, metrics and logging. Nothing here needs a display, so the headless commands and scripts import it
+without loading customtkinter.
+'''
+
+import os
+import re
+import sys
+import csv
+import errno
+import getpass
+import atexit
+import json
+import time
+import uuid
+import queue
+import random
+import bisect
+import ctypes
+import select
+import shutil
+import sqlite3
+import fnmatch
+import zipfile
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+# Used for reflink clones and to lock resumable .part files, which Windows does not have
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+# Locks resumable .part files on Windows, where fcntl is missing
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+__author__ = "Andy Hernandez"
+__date__ = "08/05/2024"
+__status__ = "Demo"
+__version__ = "1.1"
+#############################################################
+# Settings
+#############################################################
+# This should be changed based on the shared directory for a team. The home folder comes from the environment, not
+# os.getlogin, which fails without a console (scheduled tasks, services)
+DIR = os.path.join(os.path.expanduser("~"), "Desktop")
+
+# Where uploads are written. "local" copies them into DIR, "s3" puts them in S3_BUCKET of an S3 compatible object store
+# (needs boto3) with DIR's layout as the object keys after S3_PREFIX. S3_ENDPOINT is None for AWS itself
+STORAGE_TYPES = ("local", "s3")
+STORAGE_TYPE = "local"
+S3_BUCKET = "production-history"
+S3_PREFIX = ""
+S3_ENDPOINT = None
+# Files of S3_MULTIPART bytes or more are sent in S3_PART_SIZE parts, up to S3_WORKERS parts at the same time over
+# connections that are kept open between requests. Conditional writes that lost to another upload fail with S3_CONFLICTS
+S3_MULTIPART = 16 * 1024 * 1024
+S3_PART_SIZE = 8 * 1024 * 1024
+S3_WORKERS = 16
+S3_CONFLICTS = ("PreconditionFailed", "ConditionalRequestConflict", "412", "409")
+
+# Number of files copied at the same time. Copies to the share are latency bound, so overlapping them is faster.
+UPLOAD_WORKERS = 4
+
+# Order type names accepted in batch manifests, the values match the OptionsFrame radio buttons
+ORDER_TYPES = {"itar": 1, "non-itar": 2, "stock": 3}
+
+# Folder inside a tool folder that holds the work order folders and the outside files. Uploads used to go into
+# LEGACY_WO_FOLDER instead, "migrate" moves those into WO_FOLDER. Both are still read by the index and the archive
+WO_FOLDER = "02 Customer File History"
+LEGACY_WO_FOLDER = "02 - Work Orders"
+WO_FOLDERS = (WO_FOLDER, LEGACY_WO_FOLDER)
+
+# What an upload does when a file name it writes is already taken:
+#   "version"   - the same content is left alone, different content is kept next to it as name_v2.ext, name_v3.ext...
+#   "identical" - the same content is left alone, different content replaces it
+#   "overwrite" - the file is always replaced
+COLLISION_POLICIES = ("version", "identical", "overwrite")
+COLLISION_POLICY = "version"
+
+# Every copy is hashed while it is written, the hash goes into the work order manifest.json and the history index
+HASH_ALGORITHM = "sha256"
+COPY_CHUNK = 1024 * 1024
+# Copies read into at most COPY_BUFFERS reusable buffers of COPY_CHUNK_MAX bytes and wait for a free one, so the memory
+# they use stays the same however big the files are or however many are copied at once. A copy starts at the chunk size
+# the last copy to the same destination ended on (COPY_CHUNK at first), doubles it up to COPY_CHUNK_MAX while that
+# raises the throughput, and halves it down to COPY_CHUNK_MIN when a chunk takes longer than COPY_CHUNK_SECONDS
+COPY_CHUNK_MIN = 256 * 1024
+COPY_CHUNK_MAX = 8 * 1024 * 1024
+COPY_CHUNK_SECONDS = 0.5
+COPY_BUFFERS = 8
+MANIFEST_NAME = "manifest.json"
+# Uploads to the same work order take turns on its manifest through a <manifest>.lock file. A lock older than
+# LOCK_STALE seconds was left by an upload that died and is broken, waiting more than LOCK_TIMEOUT seconds is an error
+LOCK_STALE = 60
+LOCK_TIMEOUT = 30
+
+# Files at least this big are copied with a journal next to the .part file, written every JOURNAL_EVERY * RESUME_CHUNK
+# bytes, so a copy that was cut off (VPN drop, cancel) picks up from the last verified chunk the next time it is run
+RESUME_THRESHOLD = 64 * 1024 * 1024
+RESUME_CHUNK = 8 * 1024 * 1024
+JOURNAL_EVERY = 4
+
+# ioctl that makes a copy on write clone of a file (btrfs, xfs, some NFS and SMB mounts)
+FICLONE = 0x40049409
+
+# Team folders created in "01 Production Teams" for every tool
+TEAM_FOLDERS = ("Team 1", "Team 2", "Team 3", "Team 4")
+
+# Dropped folders are searched for files to upload. A file is added when its name matches one of SCAN_INCLUDE (or
+# SCAN_INCLUDE is empty) and none of SCAN_EXCLUDE, folders matching SCAN_EXCLUDE are not searched
+SCAN_INCLUDE = ()
+SCAN_EXCLUDE = ("Thumbs.db", "desktop.ini", ".DS_Store", "~$*", "*.tmp", "__MACOSX", ".git")
+# Files added to the upload list per event loop turn while a dropped folder is searched
+SCAN_BATCH = 200
+
+# Folders known to exist on the share are remembered here between runs, set to None to only remember them per process
+DIR_CACHE_PATH = os.path.join(os.path.dirname(__file__), "dirs.cache")
+
+# Queued uploads wait here until "drain" pushes them to DIR. Failed jobs are retried with exponential backoff
+# (SPOOL_BACKOFF, doubled per attempt up to SPOOL_BACKOFF_MAX seconds) and set aside in spool/failed after SPOOL_RETRIES
+SPOOL_DIR = os.path.join(os.path.dirname(__file__), "spool")
+SPOOL_RETRIES = 8
+SPOOL_BACKOFF = 30
+SPOOL_BACKOFF_MAX = 60 * 60
+
+# "migrate" moves LEGACY_WO_FOLDER into WO_FOLDER for MIGRATE_WORKERS tools at the same time. Every finished tool
+# is added to MIGRATE_CHECKPOINT, so a migration that was stopped carries on with the tools it had not done yet
+MIGRATE_WORKERS = 16
+MIGRATE_CHECKPOINT = os.path.join(os.path.dirname(__file__), "migrate.checkpoint")
+
+# Work orders nobody has touched for ARCHIVE_MONTHS are packed into one ARCHIVE_NAME zip in their folder by "archive",
+# with an ARCHIVE_STUB listing what is inside. Archives are packed on ARCHIVE_WORKERS processes
+ARCHIVE_MONTHS = 24
+ARCHIVE_NAME = "archive.zip"
+ARCHIVE_STUB = "ARCHIVED.json"
+ARCHIVE_WORKERS = 4
+
+# "ingest" routes files saved into an inbox folder by their names, e.g. "48213_12345678_drawing.pdf". The tool and work
+# order found by INGEST_PATTERN still have to pass checkTool and checkWorkOrder. Files in <inbox>/inside go in the work
+# order folder, every other file goes in the tool's customer file folder like an outside file
+INGEST_PATTERN = re.compile(r"(?<![A-Za-z0-9])(?P<tool>\d{5})[ _.-]+(?P<work_order>(?=[A-Za-z]*\d)[A-Za-z0-9]{8})(?![A-Za-z0-9])")
+# A file is only taken once it has not changed for this many seconds, so attachments still being saved are left alone
+INGEST_SETTLE = 5
+# Most files taken from the inbox in one pass, and the number of failed uploads before a file is quarantined
+INGEST_BATCH = 100
+INGEST_RETRIES = 3
+
+# program.log holds one JSON record per line, the console gets the same records as plain text
+LOG_PATH = os.path.join(os.path.dirname(__file__), "program.log")
+LOG_NAME = "ProductionHistory"
+LOG_FIELDS = ("tool", "work_order", "user", "bytes", "duration", "files", "path", "job")
+
+# Per stage timings are kept in metrics.db as daily histograms, days older than METRICS_DAYS are dropped.
+# A timing goes in the first bucket whose upper bound (in seconds) it fits under, the last bucket takes the rest.
+METRICS_PATH = os.path.join(os.path.dirname(__file__), "metrics.db")
+METRICS_DAYS = 14
+METRICS_BUCKETS = tuple(0.001 * 2 ** power for power in range(22))
+
+# Local index of the production history tree, kept next to program.log
+INDEX_PATH = os.path.join(os.path.dirname(__file__), "history.db")
+INDEX_VERSION = 2
+# Folders listed at the same time by an index refresh, listing a share is latency bound like copying to it
+INDEX_WORKERS = 16
+
+# The window suggests and checks tool and work order numbers against the ones in the history index, the tool folders
+# in DIR and REGISTRY_CSV, a CSV exported from the ERP with REGISTRY_COLUMNS as the tool and work order headers (None
+# when there is no export). While the window is open they are read again on a background thread every REGISTRY_REFRESH
+# seconds, None reads them once. The index itself is not refreshed, that walks the whole share
+REGISTRY_CSV = None
+REGISTRY_COLUMNS = ("Tool", "Work Order")
+REGISTRY_REFRESH = 5 * 60
+# Most suggestions shown under an entry
+REGISTRY_SUGGESTIONS = 5
+
+log = logging.getLogger(LOG_NAME)
+log_listener = None
+log_lock = threading.Lock()
+
+#############################################################
+# Backend
+#############################################################
+def createFolderStructure(tool, work_order, counter = None):
+    '''
+    Creates the folder structure for the tool and work order in the Production History folder, on STORAGE. Folders in
+    DIR_CACHE are not checked again, so a known tool costs at most one call for the work order folder.
+
+    Args:
+        tool (str): The tool number where this information is going to be created or added to
+        work_order (str): The work order number where this information is going to be created or added
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        None
+    '''
+    phdir = DIR
+
+    tool_path = os.path.join(phdir, tool)
+    fe_path = os.path.join(tool_path, "01 Production Teams")
+    wo_path = os.path.join(tool_path, WO_FOLDER)
+    team_paths = [os.path.join(fe_path, team) for team in TEAM_FOLDERS]
+    wo_folder = os.path.join(wo_path, work_order)
+
+    STORAGE.createFolders([tool_path, fe_path, wo_path, *team_paths, wo_folder], counter)
+
+def uploadJob(tool, work_order, order_type, in_paths, out_paths, engine, repeat = False, user = None):
+    '''
+    Creates the folder structure and places the files for one upload, used by the window and batch mode
+
+    Args:
+        tool (str): The tool number
+        work_order (str): The work order number
+        order_type (int): The selected order type (3 is stock)
+        in_paths (list): The inside file paths
+        out_paths (list): The outside file paths
+        engine (CopyEngine): The engine that copies the files
+        repeat (bool): Start the work order from the tool's previous work order
+        user (str): Who is uploading, for the log and the tool summary
+
+    Returns:
+        list: (path, exception) for every file that could not be copied
+
+    Raises:
+        FileNotFoundError: If files picked for the upload are gone, after every other file was uploaded
+    '''
+    start = time.perf_counter()
+    counter = FsCounter()
+    with METRICS.stage("createFolderStructure", counter):
+        createFolderStructure(tool, work_order, counter)
+
+    wo_folder = uploadFolders(tool, work_order)[1]
+    if (isArchived(wo_folder)):
+        # New files are not mixed into an archived work order, it is unpacked first. That is also before a repeat
+        # clone, so the archive never overwrites the files cloned from the previous work order
+        log.info(f"Restoring archived work order {tool} {work_order} before uploading to it")
+        restoreWorkOrder(wo_folder)
+
+    errors = []
+    if (repeat and not STORAGE.local):
+        # Objects cannot be cloned, the files of the previous work order would have to come back through this machine
+        log.warning(f"Repeat order {tool} {work_order} is not started from the previous work order on {STORAGE_TYPE} storage")
+    elif (repeat):
+        # Files about to be uploaded into the work order folder would only be replaced, so they are not cloned
+        skip = set() if order_type == 3 else {os.path.basename(path) for path in in_paths}
+        with METRICS.stage("clone", counter):
+            errors += repeatWorkOrder(tool, work_order, skip, counter)
+
+    errors += uploadFiles(tool, work_order, order_type, in_paths, out_paths, engine, counter, user)
+
+    # A copy whose source is gone fails with the source's own name, checking the share again would not bring it back
+    gone = [path for path, error in errors if isinstance(error, FileNotFoundError) and error.filename == path]
+    missing = {path for path, error in errors if isinstance(error, FileNotFoundError) and error.filename != path}
+    if (missing):
+        # A folder the cache knew about may have been removed, forget the tool and try those files once more
+        log.debug(f"Retrying {len(missing)} file(s) of {tool} with a fresh folder check")
+        DIR_CACHE.invalidate(os.path.join(DIR, tool))
+        createFolderStructure(tool, work_order, counter)
+        errors = [error for error in errors if error[0] not in missing]
+        errors += uploadFiles(
+            tool, work_order, order_type,
+            [path for path in in_paths if path in missing],
+            [path for path in out_paths if path in missing],
+            engine, counter, user
+        )
+
+    log.info(
+        f"Upload of {tool} {work_order} made {counter} filesystem calls",
+        extra = {
+            "tool": tool,
+            "work_order": work_order,
+            "user": user,
+            "bytes": counter.written,
+            "duration": round(time.perf_counter() - start, 3),
+            "files": len(in_paths) + len(out_paths) - len(errors)
+        }
+    )
+    METRICS.record("upload", time.perf_counter() - start, counter.written, counter.total())
+    METRICS.save()
+    if (gone):
+        raise FileNotFoundError(f"Picked file(s) no longer exist: {', '.join(gone)}")
+    return errors
+
+def uploadFiles(tool, work_order, order_type, in_paths, out_paths, engine, counter = None, user = None):
+    '''
+    Places the selected files into the tool and work order folders
+
+    Args:
+        tool (str): The tool number
+        work_order (str): The work order number
+        order_type (int): The selected order type (3 is stock)
+        in_paths (list): The inside file paths
+        out_paths (list): The outside file paths
+        engine (CopyEngine): The engine that copies the files
+        counter (FsCounter): Counts the filesystem calls made
+        user (str): Who is uploading, kept as the tool's last uploader
+
+    Returns:
+        list: (path, exception) for every file that could not be copied
+
+    Raises:
+        UploadCancelled: If the upload was cancelled, after the files that made it are in the manifest and index
+    '''
+    jobs = planUpload(tool, work_order, order_type, in_paths, out_paths, counter)
+    store = ContentStore(tool) if (engine.dedup and STORAGE.local) else None
+    cancelled = None
+    try:
+        copied, errors = engine.run(jobs, counter, store)
+    except UploadCancelled as e:
+        # The files copied before the cancel are on the share, they still go in the manifest and index
+        copied, errors, cancelled = e.copied, e.errors, e
+
+    if (store):
+        actions = [result.action for result in copied]
+        log.info(f"{tool} {work_order}: {actions.count('linked')} linked, {actions.count('skipped')} already there, "
+                 f"{actions.count('copied')} copied")
+
+    if (copied):
+        # The first jobs are the inside files, see planUpload
+        inside = {dst for src, dst in jobs[:len(in_paths)]}
+        try:
+            with METRICS.stage("manifest", counter):
+                writeManifest(tool, work_order, copied, inside, counter)
+        except (OSError, ValueError) as e:
+            log.error(f"Could not write the manifest for {tool} {work_order}: {e}")
+
+    if (INDEX and copied):
+        try:
+            with METRICS.stage("index"):
+                INDEX.recordUpload(copied, order_type, user)
+        except sqlite3.Error as e:
+            log.error(f"Could not update the history index: {e}")
+
+    if (cancelled):
+        raise cancelled
+    return errors
+
+def planUpload(tool, work_order, order_type, in_paths, out_paths, counter = None):
+    '''
+    Works out where each inside and outside file is copied to
+
+    Args:
+        tool (str): The tool number
+        work_order (str): The work order number
+        order_type (int): The selected order type (3 is stock)
+        in_paths (list): The inside file paths
+        out_paths (list): The outside file paths
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        list: (source, destination) pairs for every file
+    '''
+    folder_dst, wo_folder_dst = uploadFolders(tool, work_order)
+
+    # STOCK ORDER_MM.DD.YY
+    if (order_type == 3):
+        date = datetime.now().strftime("%m.%d.%Y")
+        wo_folder_dst = os.path.join(wo_folder_dst, f"STOCK ORDER_{date}")
+        # A second stock upload on the same day, or one running at the same time, finds the folder already there
+        STORAGE.createFolders([wo_folder_dst], counter)
+
+    jobs = []
+    for path in in_paths:
+        jobs.append((path, os.path.join(wo_folder_dst, os.path.basename(path))))
+
+    for path in out_paths:
+        jobs.append((path, os.path.join(folder_dst, os.path.basename(path))))
+    return jobs
+
+def uploadFolders(tool, work_order):
+    '''
+    Gets the folders uploads are copied into
+
+    Args:
+        tool (str): The tool number
+        work_order (str): The work order number
+
+    Returns:
+        tuple: (outside folder, work order folder)
+    '''
+    folder_dst = os.path.join(DIR, tool, WO_FOLDER)
+    return folder_dst, os.path.join(folder_dst, work_order)
+
+def writeManifest(tool, work_order, copied, inside, counter = None):
+    '''
+    Adds the copied files to the manifest.json in the work order folder. Files already in the manifest are replaced
+    by the new entry, everything else in it is kept.
+
+    Args:
+        tool (str): The tool number
+        work_order (str): The work order number
+        copied (list): CopyResult for every copied file
+        inside (set): The destinations of the inside files
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        str: The path of the manifest
+    '''
+    tool_path = os.path.join(DIR, tool)
+    manifest_path = os.path.join(uploadFolders(tool, work_order)[1], MANIFEST_NAME)
+
+    uploaded = datetime.now().isoformat(timespec = "seconds")
+    ours = {}
+    for result in copied:
+        path = os.path.relpath(result.path, tool_path).replace(os.sep, "/")
+        ours[path] = {
+            "path": path,
+            "side": "inside" if result.path in inside else "outside",
+            "size": result.size,
+            "hash": result.hash,
+            "source": result.source,
+            "action": result.action,
+            "uploaded": uploaded
+        }
+
+    STORAGE.updateManifest(manifest_path, {"tool": tool, "work_order": work_order, "algorithm": HASH_ALGORITHM}, ours, counter)
+    return manifest_path
+
+def saveManifest(manifest_path, manifest, counter = None):
+    '''
+    Writes a manifest next to manifest_path first and renames it into place, so a reader never sees half of it. The
+    caller holds the manifest's fileLock.
+
+    Args:
+        manifest_path (str): The manifest.json path
+        manifest (dict): The whole manifest
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        None
+    '''
+    if (counter):
+        counter.add("write")
+    temp_path = tempName(manifest_path, "tmp")
+    with open(temp_path, "w", encoding = "utf-8") as file:
+        json.dump(manifest, file, indent = 4)
+    os.replace(temp_path, manifest_path)
+
+@contextmanager
+def fileLock(path, counter = None):
+    '''
+    Holds <path>.lock while the block runs, made with an exclusive create so it works on any share
+
+    Args:
+        path (str): The file being protected
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        None
+
+    Raises:
+        TimeoutError: If the lock could not be taken within LOCK_TIMEOUT seconds
+    '''
+    lock_path = f"{path}.lock"
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        if (counter):
+            counter.add("lock")
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            pass
+
+        try:
+            age = time.time() - os.stat(lock_path).st_mtime
+        except FileNotFoundError:
+            continue
+        if (age > LOCK_STALE):
+            log.warning(f"Breaking {lock_path}, it is {age:.0f} seconds old")
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            continue
+        if (time.monotonic() > deadline):
+            raise TimeoutError(f"Could not lock {path}, {lock_path} is held by another upload")
+        time.sleep(random.uniform(0.01, 0.05))
+
+    try:
+        yield
+    finally:
+        os.remove(lock_path)
+
+def readManifest(manifest_path):
+    '''
+    Reads the file entries of a work order manifest
+
+    Args:
+        manifest_path (str): The manifest.json path
+
+    Returns:
+        list: The file entries, empty if there is no manifest
+    '''
+    try:
+        with open(manifest_path, encoding = "utf-8") as file:
+            return json.load(file).get("files", [])
+    except FileNotFoundError:
+        return []
+
+def latestWorkOrder(tool, exclude = None):
+    '''
+    Finds the tool's most recently changed work order folder
+
+    Args:
+        tool (str): The tool number
+        exclude (str): A work order that is not considered, normally the one being uploaded
+
+    Returns:
+        str: The work order number, None if the tool has no other work orders
+    '''
+    latest = None
+    latest_mtime = None
+    try:
+        with os.scandir(uploadFolders(tool, "")[0]) as entries:
+            for entry in entries:
+                if (not entry.is_dir() or entry.name == exclude):
+                    continue
+                mtime = entry.stat().st_mtime
+                if (latest_mtime is None or mtime > latest_mtime):
+                    latest, latest_mtime = entry.name, mtime
+    except FileNotFoundError:
+        return None
+    return latest
+
+def repeatWorkOrder(tool, work_order, skip = (), counter = None):
+    '''
+    Starts a repeat work order with the files of the tool's previous work order, subfolders such as the
+    STOCK ORDER_<date> folder of a stock order included. The files are cloned on the share (see cloneFile) so none of
+    their bytes come back through this machine.
+
+    Args:
+        tool (str): The tool number
+        work_order (str): The new work order number
+        skip (set): Names of files directly in the work order folder that are not cloned
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        list: (path, exception) for every file that could not be cloned
+    '''
+    previous = latestWorkOrder(tool, exclude = work_order)
+    if (previous is None):
+        log.info(f"Repeat order {tool} {work_order} has no previous work order to start from")
+        return []
+
+    tool_path = os.path.join(DIR, tool)
+    src_folder = uploadFolders(tool, previous)[1]
+    dst_folder = uploadFolders(tool, work_order)[1]
+    ensureFolder(dst_folder, counter)
+    if (isArchived(src_folder)):
+        log.info(f"Restoring archived work order {tool} {previous} for repeat order {work_order}")
+        restoreWorkOrder(src_folder)
+
+    # Hashes are carried over from the previous manifest so the clones do not have to be read again
+    hashes = {entry["path"]: entry.get("hash") for entry in readManifest(os.path.join(src_folder, MANIFEST_NAME))}
+
+    # (entry, path relative to the work order folder) for every file to clone, the folders are made up front
+    files = []
+    folders = [""]
+    while folders:
+        folder = folders.pop()
+        if (counter):
+            counter.add("list")
+        with os.scandir(os.path.join(src_folder, folder)) as entries:
+            for entry in entries:
+                rel = os.path.join(folder, entry.name)
+                if (entry.is_dir(follow_symlinks = False)):
+                    ensureFolder(os.path.join(dst_folder, rel), counter)
+                    folders.append(rel)
+                elif (entry.is_file() and entry.name != MANIFEST_NAME and not (folder == "" and entry.name in skip)):
+                    files.append((entry, rel))
+
+    def clone(entry, rel):
+        dst = os.path.join(dst_folder, rel)
+        method = cloneFile(entry.path, dst, counter)
+        stat = entry.stat()
+        file_hash = hashes.get(os.path.relpath(entry.path, tool_path).replace(os.sep, "/"))
+        return method, CopyResult(dst, stat.st_size, stat.st_mtime, file_hash, entry.path, "cloned")
+
+    cloned = []
+    errors = []
+    methods = {}
+    with ThreadPoolExecutor(max_workers = UPLOAD_WORKERS) as pool:
+        futures = {pool.submit(clone, entry, rel): entry.path for entry, rel in files}
+        for future in as_completed(futures):
+            try:
+                method, result = future.result()
+            except OSError as e:
+                errors.append((futures[future], e))
+                continue
+            methods[method] = methods.get(method, 0) + 1
+            cloned.append(result)
+
+    log.info(f"Repeat order {tool} {work_order} started from {previous}: {len(cloned)} file(s) cloned {methods}")
+    if (cloned):
+        writeManifest(tool, work_order, cloned, {result.path for result in cloned}, counter)
+        if (INDEX):
+            try:
+                INDEX.recordUpload(cloned)
+            except sqlite3.Error as e:
+                log.error(f"Could not update the history index: {e}")
+    return errors
+
+def checkTool(tool):
+    '''
+    Checks that a tool number has the normal format (5 digits)
+
+    Args:
+        tool (str): The tool number
+
+    Returns:
+        bool: True if the tool number looks normal
+    '''
+    return len(tool) == 5 and str(tool).isdigit()
+
+def checkWorkOrder(work_order):
+    '''
+    Checks that a work order number has the normal format (8 characters)
+
+    Args:
+        work_order (str): The work order number
+
+    Returns:
+        bool: True if the work order looks normal
+    '''
+    return len(work_order) == 8
+
+def checkCreate(folder, counter = None):
+    '''
+    Creates a directory if it does not exist. The mkdir is tried straight away, which is one trip to the share instead
+    of an exists check followed by a mkdir.
+
+    Args:
+        folder (str): The directory to create
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        bool: True if the directory was created, False if it was already there
+    '''
+    if (counter):
+        counter.add("mkdir")
+    start = time.perf_counter()
+    try:
+        os.mkdir(folder)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        METRICS.record("checkCreate", time.perf_counter() - start, calls = 1)
+
+def ensureFolder(folder, counter = None):
+    '''
+    Creates a directory, and its parents only when the directory cannot be made without them
+
+    Args:
+        folder (str): The directory to create
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        None
+    '''
+    try:
+        checkCreate(folder, counter)
+    except FileNotFoundError:
+        ensureFolder(os.path.dirname(folder), counter)
+        checkCreate(folder, counter)
+
+def scanPaths(paths, include = SCAN_INCLUDE, exclude = SCAN_EXCLUDE):
+    '''
+    Walks the given files and folders and yields files as they are found, so a large folder can be used before the
+    whole walk is done. Symbolic links to folders are not followed and folders that cannot be read are skipped.
+    include and exclude only apply to what is found inside the folders, a file given by itself is always kept.
+
+    Args:
+        paths (list): Files and folders
+        include (tuple): fnmatch patterns for file names to keep, empty keeps every file
+        exclude (tuple): fnmatch patterns for file and folder names to leave out
+
+    Returns:
+        generator: (path, size) for every file, size is None if the file could not be read
+    '''
+    def wanted(name, is_dir):
+        if (any(fnmatch.fnmatch(name, pattern) for pattern in exclude)):
+            return False
+        return is_dir or not include or any(fnmatch.fnmatch(name, pattern) for pattern in include)
+
+    for path in paths:
+        if (not os.path.isdir(path)):
+            try:
+                yield path, os.stat(path).st_size
+            except OSError:
+                yield path, None
+            continue
+
+        # Depth first with an explicit stack, entries are sorted so the list reads like the folder
+        stack = [path]
+        while stack:
+            folder = stack.pop()
+            try:
+                with os.scandir(folder) as scan:
+                    entries = sorted(scan, key = lambda entry: entry.name.lower())
+            except OSError as e:
+                log.warning(f"Could not read {folder}: {e}")
+                continue
+
+            folders = []
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks = False)
+                    if (not is_dir and entry.is_symlink() and entry.is_dir()):
+                        continue
+                except OSError:
+                    continue
+                if (not wanted(entry.name, is_dir)):
+                    continue
+                if (is_dir):
+                    folders.append(entry.path)
+                    continue
+                try:
+                    yield entry.path, entry.stat().st_size
+                except OSError:
+                    yield entry.path, None
+            stack.extend(reversed(folders))
+
+class FsCounter:
+    '''
+    Counts the filesystem calls made for one upload, by kind of call
+
+    Args:
+        None
+
+    Returns:
+        None
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.written = 0
+
+    def add(self, kind, count = 1):
+        '''
+        Adds calls of one kind
+
+        Args:
+            kind (str): The kind of call (mkdir, stat, copy...)
+            count (int): The number of calls
+
+        Returns:
+            None
+        '''
+        with self.lock:
+            self.counts[kind] = self.counts.get(kind, 0) + count
+
+    def addBytes(self, size):
+        '''
+        Adds to the number of bytes written to the share
+
+        Args:
+            size (int): The number of bytes
+
+        Returns:
+            None
+        '''
+        with self.lock:
+            self.written += size
+
+    def merge(self, other):
+        '''
+        Adds the calls and bytes of another counter
+
+        Args:
+            other (FsCounter): The counter being added
+
+        Returns:
+            None
+        '''
+        with self.lock:
+            for kind, count in other.counts.items():
+                self.counts[kind] = self.counts.get(kind, 0) + count
+            self.written += other.written
+
+    def total(self):
+        '''
+        Gets the number of calls of every kind
+
+        Args:
+            None
+
+        Returns:
+            int: The total number of calls
+        '''
+        return sum(self.counts.values())
+
+    def __str__(self):
+        kinds = ", ".join(f"{kind} {count}" for kind, count in sorted(self.counts.items()))
+        return f"{self.total()} ({kinds})" if kinds else "0"
+
+class DirCache:
+    '''
+    Remembers directories that are known to exist on the share so they are not checked again
+
+    Args:
+        path (str): The file the directories are kept in between runs, None to only keep them in memory
+
+    Returns:
+        None
+    '''
+    def __init__(self, path = None):
+        self.path = path
+        self.known = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        '''
+        Reads the saved directories the first time the cache is used
+
+        Args:
+            None
+
+        Returns:
+            set: The known directories
+        '''
+        if (self.known is None):
+            self.known = set()
+            if (self.path and os.path.exists(self.path)):
+                with open(self.path, encoding = "utf-8") as file:
+                    self.known = {line.rstrip("\n") for line in file if line.strip()}
+        return self.known
+
+    def key(self, folder):
+        '''
+        Normalises a directory so the same folder always gives the same entry
+
+        Args:
+            folder (str): The directory
+
+        Returns:
+            str: The cache entry
+        '''
+        return os.path.normcase(os.path.abspath(folder))
+
+    def __contains__(self, folder):
+        with self.lock:
+            return self.key(folder) in self.load()
+
+    def add(self, folders):
+        '''
+        Remembers directories that exist
+
+        Args:
+            folders (list): The directories
+
+        Returns:
+            None
+        '''
+        with self.lock:
+            known = self.load()
+            new = [key for key in dict.fromkeys(self.key(folder) for folder in folders) if key not in known]
+            known.update(new)
+            if (self.path and new):
+                try:
+                    with open(self.path, "a", encoding = "utf-8") as file:
+                        file.writelines(f"{key}\n" for key in new)
+                except OSError as e:
+                    log.warning(f"Could not save the folder cache: {e}")
+
+    def invalidate(self, folder):
+        '''
+        Forgets a directory and every directory below it, used when the share did not match the cache
+
+        Args:
+            folder (str): The directory
+
+        Returns:
+            None
+        '''
+        with self.lock:
+            key = self.key(folder)
+            prefix = os.path.join(key, "")
+            self.known = {entry for entry in self.load() if entry != key and not entry.startswith(prefix)}
+            if (self.path):
+                try:
+                    with open(self.path, "w", encoding = "utf-8") as file:
+                        file.writelines(f"{entry}\n" for entry in sorted(self.known))
+                except OSError as e:
+                    log.warning(f"Could not save the folder cache: {e}")
+
+DIR_CACHE = DirCache(DIR_CACHE_PATH)
+
+#############################################################
+# Copy Engine
+#############################################################
+# action is "copied", "linked" to a file with the same content, or "skipped" when the destination already had it
+CopyResult = namedtuple("CopyResult", ["path", "size", "mtime", "hash", "source", "action"], defaults = ["copied"])
+
+class UploadCancelled(Exception):
+    '''
+    Raised when an upload is cancelled before every file was copied
+
+    Args:
+        message (str): What was not copied
+        copied (list): A CopyResult for every copy that finished before the cancel
+        errors (list): (source, exception) for every copy that failed before the cancel
+
+    Returns:
+        None
+    '''
+    def __init__(self, message, copied = None, errors = None):
+        super().__init__(message)
+        self.copied = copied or []
+        self.errors = errors or []
+
+class CopyEngine:
+    '''
+    Copies files on a bounded pool of worker threads
+
+    Args:
+        workers (int): The number of copies that can run at the same time
+        progress (function): Called with (done, total, path, error) after every finished copy, from a worker thread.
+                             error is None when the copy worked
+        dedup (bool): Hard link files whose content is already under the tool instead of copying them
+        limiter (RateLimiter): Caps the bytes per second written to the share, None for no cap
+        policy (str): What to do when a file name is already taken, one of COLLISION_POLICIES
+
+    Returns:
+        None
+    '''
+    def __init__(self, workers = UPLOAD_WORKERS, progress = None, dedup = False, limiter = None, policy = COLLISION_POLICY):
+        self.workers = max(1, workers)
+        self.progress = progress
+        self.dedup = dedup
+        self.limiter = limiter
+        self.policy = policy
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        '''
+        Stops any copy that has not started yet
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        self.cancelled.set()
+
+    def run(self, jobs, counter = None, store = None):
+        '''
+        Copies every (source, destination) pair, the order the copies finish in is not fixed
+
+        Args:
+            jobs (list): (source, destination) pairs
+            counter (FsCounter): Counts the filesystem calls made
+            store (ContentStore): Looks up content that is already on the share, None to always copy
+
+        Returns:
+            tuple: (copied, errors), copied holds a CopyResult for every finished copy and errors holds
+                   (source, exception) for every copy that failed
+
+        Raises:
+            UploadCancelled: If the engine was cancelled before every copy started, carrying the copies that finished
+        '''
+        copied = []
+        errors = []
+        done = 0
+        skipped = 0
+        with ThreadPoolExecutor(max_workers = self.workers) as pool:
+            futures = {pool.submit(self.copy, src, dst, counter, store): src for src, dst in jobs}
+            for future in as_completed(futures):
+                src = futures[future]
+                error = None
+                try:
+                    copied.append(future.result())
+                except UploadCancelled:
+                    skipped += 1
+                    continue
+                except Exception as e:
+                    error = e
+                    errors.append((src, e))
+                done += 1
+                if (self.progress):
+                    self.progress(done, len(futures), src, error)
+
+        if (skipped):
+            raise UploadCancelled(f"{skipped} of {len(jobs)} files were not copied", copied, errors)
+        return copied, errors
+
+    def copy(self, src, dst, counter = None, store = None):
+        '''
+        Copies a single file unless the engine has been cancelled
+
+        Args:
+            src (str): The file being copied
+            dst (str): Where the file is copied to
+            counter (FsCounter): Counts the filesystem calls made
+            store (ContentStore): Looks up content that is already on the share, None to always copy
+
+        Returns:
+            CopyResult: The copied file
+        '''
+        if (self.cancelled.is_set()):
+            raise UploadCancelled(src)
+        if (store):
+            result = store.place(src, dst, counter, self.policy)
+            if (result):
+                log.debug(f"{result.action.capitalize()} {src}", extra = {"path": dst, "bytes": 0})
+                return result
+
+        # Counted on their own first so the metrics get the calls of this copy alone
+        file_counter = FsCounter()
+        start = time.perf_counter()
+        path, size, file_hash, action = STORAGE.copy(src, dst, file_counter, self.cancelled, self.limiter, self.policy)
+        duration = time.perf_counter() - start
+        file_counter.addBytes(size)
+        METRICS.record("copy", duration, size, file_counter.total())
+        if (counter):
+            counter.merge(file_counter)
+        log.debug(f"{action.capitalize()} {src}", extra = {"path": path, "bytes": size, "duration": round(duration, 3)})
+
+        # copyFile keeps the modified time, so the source describes the copy without another trip to the share
+        result = CopyResult(path, size, os.stat(src).st_mtime, file_hash, src, action)
+        if (store):
+            store.add(result)
+        return result
+
+class BufferPool:
+    '''
+    Reusable copy buffers. A buffer is made the first time one is needed and kept for the next copy, at most count of
+    them; a copy that finds none free waits for one to come back.
+
+    Args:
+        count (int): The most buffers made
+        size (int): The size of each buffer in bytes
+
+    Returns:
+        None
+    '''
+    def __init__(self, count = COPY_BUFFERS, size = COPY_CHUNK_MAX):
+        self.count = max(1, count)
+        self.size = size
+        self.made = 0
+        # The buffer used last is handed out first, its pages are the most likely to still be in memory
+        self.free = queue.LifoQueue()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def buffer(self):
+        '''
+        Lends a buffer for the with block. Nothing in the block may ask for a second one, that could wait forever.
+
+        Args:
+            None
+
+        Returns:
+            memoryview: The whole buffer, slices of it are read into without copying
+        '''
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                make = self.made < self.count
+                self.made += make
+            buffer = bytearray(self.size) if make else self.free.get()
+        try:
+            with memoryview(buffer) as view:
+                yield view
+        finally:
+            self.free.put(buffer)
+
+BUFFERS = BufferPool()
+
+class ChunkSizer:
+    '''
+    Picks the chunk size of a copy from the throughput it gets. The size doubles while that makes the copy faster and
+    is halved when a chunk takes longer than COPY_CHUNK_SECONDS, which keeps cancelling and the rate limit responsive on
+    a slow link. The size a copy ends on is remembered per destination and is where the next copy there starts.
+
+    Args:
+        destination: Tells destinations apart, the st_dev of the destination file
+
+    Returns:
+        None
+    '''
+    learned = {}
+
+    def __init__(self, destination):
+        self.destination = destination
+        self.size = min(max(self.learned.get(destination, COPY_CHUNK), COPY_CHUNK_MIN), COPY_CHUNK_MAX)
+        self.best = 0.0
+        self.growing = True
+
+    def update(self, size, seconds):
+        '''
+        Takes the time one chunk took and picks the size of the next one
+
+        Args:
+            size (int): The bytes in the chunk
+            seconds (float): How long reading, hashing and writing it took
+
+        Returns:
+            int: The size of the next chunk
+        '''
+        rate = size / max(seconds, 1e-6)
+        if (seconds > COPY_CHUNK_SECONDS and self.size > COPY_CHUNK_MIN):
+            self.size = max(COPY_CHUNK_MIN, self.size // 2)
+            self.growing = False
+        elif (self.growing and size == self.size):
+            if (rate > self.best * 1.1 and self.size < COPY_CHUNK_MAX):
+                self.best = rate
+                self.size = min(COPY_CHUNK_MAX, self.size * 2)
+            else:
+                # Doubling did not pay off, go back to the size before it and stay there
+                if (rate < self.best):
+                    self.size = max(COPY_CHUNK_MIN, self.size // 2)
+                self.growing = False
+        self.learned[self.destination] = self.size
+        return self.size
+
+def copyFile(src, dst, counter = None, cancelled = None, limiter = None, policy = COLLISION_POLICY):
+    '''
+    Copies a file and hashes it in the same pass, then checks that the whole file landed. The copy is written to a
+    temporary name and only published under dst (see publishFile) once it is complete, so a half written file is never
+    visible. Files of RESUME_THRESHOLD or more are written to <dst>.part with a journal of how far it is known to be
+    written, and a later copy of the same file carries on from there. The .part file is locked while it is written, a
+    second uploader of the same file writes its own temporary file instead. The data goes through a buffer from BUFFERS
+    in chunks sized by a ChunkSizer, and the bytes that are hashed are the bytes that are written.
+
+    Args:
+        src (str): The file being copied
+        dst (str): Where the file is copied to
+        counter (FsCounter): Counts the filesystem calls made
+        cancelled (threading.Event): Stops a resumable copy between chunks when set, the journal is kept
+        limiter (RateLimiter): Caps the bytes per second written, None for no cap
+        policy (str): What to do when dst is already taken, one of COLLISION_POLICIES
+
+    Returns:
+        tuple: (path, size, hash, action) of the copied file, path can differ from dst under the "version" policy and
+               action is "skipped" if the same content was already there
+
+    Raises:
+        OSError: If the destination size does not match what was written
+        UploadCancelled: If cancelled was set during the copy
+    '''
+    stat = os.stat(src)
+    hasher = hashlib.new(HASH_ALGORITHM)
+    resumable = stat.st_size >= RESUME_THRESHOLD
+    temp_path = f"{dst}.part"
+    journal_path = f"{temp_path}.journal"
+
+    if (counter):
+        counter.add("copy")
+    fdst = openLocked(temp_path) if resumable else None
+    if (resumable and fdst is None):
+        log.info(f"{temp_path} is being written by another upload, copying {src} without resume")
+        resumable = False
+    if (not resumable):
+        # Writing into dst itself could also change a file it is hard linked to
+        temp_path = tempName(dst, "part")
+        fdst = open(temp_path, "wb")
+
+    # A locked .part file stays open until it is published so nobody else can pick it up in between. Windows cannot
+    # rename an open file, there it is closed first and a rename that races another writer fails instead
+    hold_open = resumable and os.name != "nt"
+    try:
+        # Unbuffered, every read goes straight into the pooled buffer
+        with open(src, "rb", buffering = 0) as fsrc, BUFFERS.buffer() as view:
+            size = resumePoint(src, stat, fdst, journal_path, counter) if resumable else 0
+            if (size):
+                log.info(f"Resuming {dst} at {size} of {stat.st_size} bytes")
+                # The hash up to the resume point is rebuilt from the local source, not read back from the share
+                remaining = size
+                while remaining:
+                    read = fsrc.readinto(view[:min(len(view), remaining)])
+                    if (not read):
+                        raise OSError(f"{src} is shorter than the {size} bytes already copied")
+                    hasher.update(view[:read])
+                    remaining -= read
+            fdst.seek(size)
+            fdst.truncate()
+
+            sizer = ChunkSizer(os.fstat(fdst.fileno()).st_dev)
+            journaled = size
+            while True:
+                if (resumable and cancelled and cancelled.is_set()):
+                    raise UploadCancelled(src)
+                started = time.perf_counter()
+                read = fsrc.readinto(view[:sizer.size])
+                if (not read):
+                    break
+                chunk = view[:read]
+                if (limiter):
+                    limiter.wait(read)
+                hasher.update(chunk)
+                fdst.write(chunk)
+                size += read
+                sizer.update(read, time.perf_counter() - started)
+
+                if (resumable and size - journaled >= RESUME_CHUNK * JOURNAL_EVERY):
+                    # Only bytes that are flushed to the share are recorded
+                    fdst.flush()
+                    os.fsync(fdst.fileno())
+                    writeJournal(journal_path, src, stat, size, chunk, counter)
+                    journaled = size
+        fdst.flush()
+        if (not hold_open):
+            fdst.close()
+        shutil.copystat(src, temp_path)
+
+        if (counter):
+            counter.add("stat")
+        landed = os.stat(temp_path).st_size
+        if (landed != size):
+            # Nothing in a .part file that came out the wrong size can be trusted for a resume
+            if (resumable):
+                resumable = False
+                removeJournal(journal_path)
+            raise OSError(f"{dst} is {landed} bytes after the copy, {size} bytes were written")
+        path, action = publishFile(temp_path, dst, size, hasher.hexdigest(), policy, counter)
+        if (resumable):
+            removeJournal(journal_path)
+        fdst.close()
+    except BaseException:
+        fdst.close()
+        # A resumable .part is kept for the next try, any other temporary file is removed
+        if (not resumable):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+        raise
+
+    return path, size, hasher.hexdigest(), action
+
+def removeJournal(journal_path):
+    '''
+    Removes the journal of a resumable copy if there is one
+
+    Args:
+        journal_path (str): The journal next to the .part file
+
+    Returns:
+        None
+    '''
+    try:
+        os.remove(journal_path)
+    except FileNotFoundError:
+        pass
+
+def tempName(path, suffix):
+    '''
+    Gets a temporary name next to a file that no other upload will pick
+
+    Args:
+        path (str): The file the temporary name is for
+        suffix (str): Says what made the file (part, link, clone)
+
+    Returns:
+        str: The temporary path
+    '''
+    return f"{path}.{uuid.uuid4().hex[:8]}.{suffix}"
+
+def openLocked(path):
+    '''
+    Opens a file for writing without truncating it and takes an exclusive lock on it. The lock goes away when the file
+    is closed or the process ends.
+
+    Args:
+        path (str): The file, it is created if it does not exist
+
+    Returns:
+        file: The open file, None if another process holds the lock
+    '''
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+    file = os.fdopen(fd, "r+b")
+    try:
+        if (fcntl):
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif (msvcrt):
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        file.close()
+        return None
+    return file
+
+def publishFile(temp_path, dst, size, file_hash, policy = COLLISION_POLICY, counter = None):
+    '''
+    Moves a finished temporary file to its destination following a collision policy. Every step is a single rename or
+    link, so other uploads and readers only ever see the old file or the whole new one.
+
+    Args:
+        temp_path (str): The finished file under its temporary name
+        dst (str): Where the file goes
+        size (int): The size of the file
+        file_hash (str): The hash of the file
+        policy (str): What to do when dst is already taken, one of COLLISION_POLICIES
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        tuple: (path, action), path is where the content ended up and action is "copied" or "skipped"
+
+    Raises:
+        ValueError: If the policy is not one of COLLISION_POLICIES
+    '''
+    if (policy not in COLLISION_POLICIES):
+        raise ValueError(f"Unknown collision policy {policy}")
+    if (counter):
+        counter.add("rename")
+
+    if (policy == "overwrite"):
+        os.replace(temp_path, dst)
+        return dst, "copied"
+
+    if (policy == "identical"):
+        if (sameContent(dst, size, file_hash, counter)):
+            os.remove(temp_path)
+            return dst, "skipped"
+        os.replace(temp_path, dst)
+        return dst, "copied"
+
+    # "version" takes the first name in dst, name_v2.ext, name_v3.ext... that is free or already holds the content
+    stem, ext = os.path.splitext(dst)
+    version = 1
+    while True:
+        path = dst if version == 1 else f"{stem}_v{version}{ext}"
+        if (placeNew(temp_path, path)):
+            return path, "copied"
+        if (sameContent(path, size, file_hash, counter)):
+            os.remove(temp_path)
+            return path, "skipped"
+        version += 1
+
+def placeNew(temp_path, path):
+    '''
+    Renames a file to a path only if nothing is there, in one step so two uploads cannot both take the same name
+
+    Args:
+        temp_path (str): The file under its temporary name
+        path (str): The new name
+
+    Returns:
+        bool: True if the file now has the new name, False if the name was taken
+    '''
+    if (os.name == "nt"):
+        # Windows rename never replaces an existing file
+        try:
+            os.rename(temp_path, path)
+        except FileExistsError:
+            return False
+        return True
+
+    try:
+        os.link(temp_path, path)
+    except FileExistsError:
+        return False
+    except OSError as e:
+        # Shares without hard links, here the check and the rename are separate steps
+        log.debug(f"Could not link {temp_path}, renaming instead: {e}")
+        if (os.path.lexists(path)):
+            return False
+        os.rename(temp_path, path)
+        return True
+    os.remove(temp_path)
+    return True
+
+def sameContent(path, size, file_hash, counter = None):
+    '''
+    Checks if a file holds the given content, the size is compared before the file is read
+
+    Args:
+        path (str): The file
+        size (int): The expected size
+        file_hash (str): The expected hash
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        bool: True if the file exists and has the same size and hash
+    '''
+    if (counter):
+        counter.add("stat")
+    try:
+        if (os.stat(path).st_size != size):
+            return False
+        if (counter):
+            counter.add("read")
+        return hashFile(path) == file_hash
+    except OSError:
+        return False
+
+class RateLimiter:
+    '''
+    Token bucket shared by every copy that should stay under one rate
+
+    Args:
+        rate (float): The bytes per second allowed
+
+    Returns:
+        None
+    '''
+    def __init__(self, rate):
+        self.rate = rate
+        self.allowance = rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self, size):
+        '''
+        Blocks until size bytes can be sent
+
+        Args:
+            size (int): The number of bytes about to be written
+
+        Returns:
+            None
+        '''
+        with self.lock:
+            now = time.monotonic()
+            # At most one second of unused rate is saved up, so idle time does not turn into a burst
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= size
+            delay = -self.allowance / self.rate if self.allowance < 0 else 0
+        if (delay):
+            time.sleep(delay)
+
+def chunkDigest(chunk):
+    '''
+    Gets the short digest used to check a journaled chunk
+
+    Args:
+        chunk (bytes): The chunk
+
+    Returns:
+        str: The hex digest
+    '''
+    return hashlib.blake2b(chunk, digest_size = 16).hexdigest()
+
+def writeJournal(journal_path, src, stat, size, chunk, counter = None):
+    '''
+    Records how much of a resumable copy is safely written
+
+    Args:
+        journal_path (str): The journal next to the .part file
+        src (str): The file being copied
+        stat (os.stat_result): The stat of the source when the copy started
+        size (int): The number of bytes flushed to the .part file
+        chunk (bytes): The last chunk written, it is checked again before resuming
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        None
+    '''
+    if (counter):
+        counter.add("write")
+    journal = {
+        "source": src,
+        "source_size": stat.st_size,
+        "source_mtime": stat.st_mtime,
+        "chunk_size": RESUME_CHUNK,
+        "size": size,
+        "last_size": len(chunk),
+        "last_digest": chunkDigest(chunk)
+    }
+    with open(journal_path, "w", encoding = "utf-8") as file:
+        json.dump(journal, file)
+
+def resumePoint(src, stat, part, journal_path, counter = None):
+    '''
+    Works out where an interrupted copy can carry on from. The journal has to belong to the same unchanged source and
+    the last chunk it recorded has to read back the same from the .part file, otherwise the copy starts over.
+
+    Args:
+        src (str): The file being copied
+        stat (os.stat_result): The current stat of the source
+        part (file): The open .part file
+        journal_path (str): The journal next to the .part file
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        int: The number of bytes that do not need to be copied again
+    '''
+    if (counter):
+        counter.add("read")
+    try:
+        with open(journal_path, encoding = "utf-8") as file:
+            journal = json.load(file)
+    except (OSError, ValueError):
+        return 0
+
+    same_source = (
+        journal.get("source") == src
+        and journal.get("source_size") == stat.st_size
+        and journal.get("source_mtime") == stat.st_mtime
+        and journal.get("chunk_size") == RESUME_CHUNK
+    )
+    if (not same_source):
+        return 0
+
+    size = journal["size"]
+    start = size - journal["last_size"]
+    if (counter):
+        counter.add("read")
+    try:
+        part.seek(start)
+        if (chunkDigest(part.read(journal["last_size"])) != journal["last_digest"]):
+            return 0
+    except OSError:
+        return 0
+    return size
+
+def hashFile(path):
+    '''
+    Hashes a file with HASH_ALGORITHM
+
+    Args:
+        path (str): The file
+
+    Returns:
+        str: The hex digest
+    '''
+    hasher = hashlib.new(HASH_ALGORITHM)
+    with open(path, "rb", buffering = 0) as file, BUFFERS.buffer() as view:
+        while True:
+            read = file.readinto(view)
+            if (not read):
+                break
+            hasher.update(view[:read])
+    return hasher.hexdigest()
+
+def linkFile(src, dst):
+    '''
+    Hard links a file to a new name, replacing the destination the way a copy would
+
+    Args:
+        src (str): The existing file
+        dst (str): The new name
+
+    Returns:
+        None
+    '''
+    # Linked under a temporary name and renamed over the destination, so it is never missing or half made
+    temp_path = tempName(dst, "link")
+    try:
+        os.link(src, temp_path)
+        os.replace(temp_path, dst)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def cloneFile(src, dst, counter = None):
+    '''
+    Copies a file that is already on the share without pulling its bytes through this machine. A copy on write reflink
+    is tried first, then a hard link, then a server side copy_file_range, and a normal copy as a last resort.
+
+    Args:
+        src (str): The file on the share
+        dst (str): Where the copy goes, on the same share
+        counter (FsCounter): Counts the filesystem calls made
+
+    Returns:
+        str: How the file was cloned (reflink, link, copy_file_range or copy)
+    '''
+    if (counter):
+        counter.add("clone")
+
+    # Clones are made under a temporary name, writing into dst could change a file it is hard linked to
+    temp_path = tempName(dst, "clone")
+    try:
+        if (fcntl):
+            try:
+                with open(src, "rb") as fsrc, open(temp_path, "wb") as fdst:
+                    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                shutil.copystat(src, temp_path)
+                os.replace(temp_path, dst)
+                return "reflink"
+            except OSError:
+                pass
+
+        try:
+            linkFile(src, dst)
+            return "link"
+        except OSError:
+            pass
+
+        if (hasattr(os, "copy_file_range")):
+            try:
+                with open(src, "rb") as fsrc, open(temp_path, "wb") as fdst:
+                    while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                        pass
+                shutil.copystat(src, temp_path)
+                os.replace(temp_path, dst)
+                return "copy_file_range"
+            except OSError:
+                pass
+
+        shutil.copy2(src, temp_path)
+        os.replace(temp_path, dst)
+        return "copy"
+    finally:
+        # A reflink or copy_file_range that failed leaves its temporary file behind
+        if (os.path.lexists(temp_path)):
+            os.remove(temp_path)
+
+class ContentStore:
+    '''
+    Content addressed store of the files already under one tool. The hash -> file map is loaded from the history index
+    once per upload, so finding a duplicate never walks the tool folder. The size and modified time of each file are
+    kept with it, so a file edited since it was hashed is never linked.
+
+    Args:
+        tool (str): The tool number
+
+    Returns:
+        None
+    '''
+    def __init__(self, tool):
+        self.tool = tool
+        self.lock = threading.Lock()
+        self.known = {}
+        if (INDEX):
+            try:
+                for path, size, mtime, file_hash in INDEX.files(tool):
+                    if (file_hash):
+                        self.known.setdefault((file_hash, size), (path, mtime))
+            except sqlite3.Error as e:
+                log.error(f"Could not read the history index, duplicates will be copied: {e}")
+
+    def add(self, result):
+        '''
+        Remembers a file that was copied, so the same content later in the upload can link to it
+
+        Args:
+            result (CopyResult): The copied file
+
+        Returns:
+            None
+        '''
+        with self.lock:
+            self.known.setdefault((result.hash, result.size), (result.path, result.mtime))
+
+    def place(self, src, dst, counter = None, policy = COLLISION_POLICY):
+        '''
+        Puts a file in place without copying it when its content is already under the tool. The source is hashed
+        locally first; a match is hard linked to the destination, or left alone if it already is the destination.
+        A match whose size or modified time changed since it was hashed is hashed again before it is trusted.
+
+        Args:
+            src (str): The file being uploaded
+            dst (str): Where the file goes
+            counter (FsCounter): Counts the filesystem calls made
+            policy (str): What to do when dst is already taken, one of COLLISION_POLICIES
+
+        Returns:
+            CopyResult: The placed file, or None if it has to be copied
+        '''
+        stat = os.stat(src)
+        file_hash = hashFile(src)
+        with self.lock:
+            known = self.known.get((file_hash, stat.st_size))
+        if (known is None):
+            return None
+        match, known_mtime = known
+
+        # The index can be behind the share, make sure the match is still there with the same content
+        if (counter):
+            counter.add("stat")
+        try:
+            match_stat = os.stat(match)
+            if (match_stat.st_size != stat.st_size):
+                return None
+            if (match_stat.st_mtime != known_mtime):
+                if (counter):
+                    counter.add("read")
+                if (hashFile(match) != file_hash):
+                    log.debug(f"{match} changed since it was indexed, copying {src} instead")
+                    # Let the copy take its place, so the rest of the upload links to good content, and have the
+                    # next refresh pick up the edit
+                    with self.lock:
+                        if (self.known.get((file_hash, stat.st_size)) == known):
+                            del self.known[(file_hash, stat.st_size)]
+                    invalidateIndex([os.path.dirname(match)])
+                    return None
+        except OSError:
+            return None
+
+        # A link shares the match's modified time, so that is what the history index gets
+        if (os.path.normcase(os.path.abspath(match)) == os.path.normcase(os.path.abspath(dst))):
+            return CopyResult(dst, stat.st_size, match_stat.st_mtime, file_hash, src, "skipped")
+
+        if (counter):
+            counter.add("link")
+        temp_path = tempName(dst, "link")
+        try:
+            os.link(match, temp_path)
+        except OSError as e:
+            log.debug(f"Could not link {match} to {dst}, copying instead: {e}")
+            return None
+        try:
+            path, action = publishFile(temp_path, dst, stat.st_size, file_hash, policy, counter)
+        except OSError:
+            os.remove(temp_path)
+            raise
+        return CopyResult(path, stat.st_size, match_stat.st_mtime, file_hash, src, "linked" if action == "copied" else action)
+
+#############################################################
+# Storage
+#############################################################
+class LocalStorage:
+    '''
+    Writes uploads into DIR on a local disk or a mounted share
+
+    Args:
+        None
+
+    Returns:
+        None
+    '''
+    # Files can be hard linked and cloned next to each other, which dedup and repeat orders need
+    local = True
+
+    def location(self):
+        '''
+        Says where uploads go, for messages
+
+        Args:
+            None
+
+        Returns:
+            str: DIR
+        '''
+        return DIR
+
+    def available(self):
+        '''
+        Checks that the share can be reached
+
+        Args:
+            None
+
+        Returns:
+            bool: True if DIR is there
+        '''
+        return os.path.isdir(DIR)
+
+    def createFolders(self, folders, counter = None):
+        '''
+        Creates folders, parents before their children. Folders in DIR_CACHE are not checked again.
+
+        Args:
+            folders (list): The folders, the first one holds all the others
+            counter (FsCounter): Counts the filesystem calls made
+
+        Returns:
+            None
+        '''
+        if (all(folder in DIR_CACHE for folder in folders)):
+            return
+
+        # A top folder that did not exist yet needs everything below it, so each folder is made without looking first.
+        # Another upload of the same new tool can make them at the same time, a folder it made first is left alone
+        if (folders[0] not in DIR_CACHE and checkCreate(folders[0], counter)):
+            for folder in folders[1:]:
+                checkCreate(folder, counter)
+            DIR_CACHE.add(folders)
+            return
+
+        # Only the deepest folders are tried and their parents are made when they turn out to be missing
+        for folder in folders[1:]:
+            if (folder not in DIR_CACHE and not any(other.startswith(folder + os.sep) for other in folders)):
+                ensureFolder(folder, counter)
+        DIR_CACHE.add(folders)
+
+    def copy(self, src, dst, counter = None, cancelled = None, limiter = None, policy = COLLISION_POLICY):
+        '''
+        Copies a file into place, see copyFile
+
+        Args:
+            src (str): The file being copied
+            dst (str): Where the file goes
+            counter (FsCounter): Counts the filesystem calls made
+            cancelled (threading.Event): Stops the copy when set
+            limiter (RateLimiter): Caps the bytes per second written, None for no cap
+            policy (str): What to do when dst is already taken, one of COLLISION_POLICIES
+
+        Returns:
+            tuple: (path, size, hash, action)
+        '''
+        return copyFile(src, dst, counter, cancelled, limiter, policy)
+
+    def updateManifest(self, manifest_path, header, entries, counter = None):
+        '''
+        Adds entries to a manifest, entries already in it for the same paths are replaced
+
+        Args:
+            manifest_path (str): The manifest.json path
+            header (dict): The manifest fields besides "files"
+            entries (dict): The new file entries by path
+            counter (FsCounter): Counts the filesystem calls made
+
+        Returns:
+            None
+        '''
+        # Another upload to the same work order could otherwise replace the manifest between this read and write
+        with fileLock(manifest_path, counter):
+            if (counter):
+                counter.add("read")
+            files = {entry["path"]: entry for entry in readManifest(manifest_path)}
+            files.update(entries)
+            saveManifest(manifest_path, {**header, "files": sorted(files.values(), key = lambda entry: entry["path"])}, counter)
+
+class S3Storage:
+    '''
+    Writes uploads into a bucket of an S3 compatible object store. Paths under DIR are used as object keys under the
+    prefix, so the layout is the same as on the share. Big files are sent as multipart uploads with their parts
+    going out at the same time, and a file whose object is already there with the same content is not sent again.
+    boto3 is only imported once the storage is first used.
+
+    Args:
+        bucket (str): The bucket
+        prefix (str): Put in front of every key
+        endpoint (str): The endpoint url of the object store, None for AWS
+
+    Returns:
+        None
+    '''
+    # Objects cannot be linked or cloned, uploads always send the bytes
+    local = False
+
+    def __init__(self, bucket = S3_BUCKET, prefix = S3_PREFIX, endpoint = S3_ENDPOINT):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint = endpoint
+        self.client = None
+        self.pool = None
+        self.known = set()
+        self.lock = threading.Lock()
+
+    def connect(self):
+        '''
+        Makes the client and the part upload pool the first time they are needed. The client keeps a pool of open
+        connections big enough for every file and part upload running at the same time, and it is shared by them.
+
+        Args:
+            None
+
+        Returns:
+            botocore.client.S3: The client
+
+        Raises:
+            OSError: If boto3 is not installed
+        '''
+        with self.lock:
+            if (self.client is None):
+                try:
+                    import boto3
+                    from botocore.config import Config
+                except ImportError as e:
+                    raise OSError("S3 storage needs boto3, install it with \"pip install boto3\"") from e
+                config = Config(max_pool_connections = S3_WORKERS + UPLOAD_WORKERS, retries = {"mode": "standard"})
+                self.client = boto3.client("s3", endpoint_url = self.endpoint, config = config)
+                self.pool = ThreadPoolExecutor(max_workers = S3_WORKERS, thread_name_prefix = "s3-part")
+        return self.client
+
+    def location(self):
+        '''
+        Says where uploads go, for messages
+
+        Args:
+            None
+
+        Returns:
+            str: The bucket and prefix as an s3:// url
+        '''
+        return f"s3://{self.bucket}/{self.prefix}"
+
+    def available(self):
+        '''
+        Checks that the bucket can be reached
+
+        Args:
+            None
+
+        Returns:
+            bool: True if the bucket answered
+        '''
+        try:
+            self.connect().head_bucket(Bucket = self.bucket)
+            return True
+        except Exception as e:
+            log.debug(f"{self.location()} is not reachable: {e}")
+            return False
+
+    def key(self, path):
+        '''
+        Gets the object key of a path under DIR
+
+        Args:
+            path (str): The path
+
+        Returns:
+            str: The key
+        '''
+        return self.prefix + os.path.relpath(path, DIR).replace(os.sep, "/")
+
+    def createFolders(self, folders, counter = None):
+        '''
+        Puts an empty "folder/" object for every folder, which is how object store browsers show an empty folder.
+        Folders this storage has made before are left alone.
+
+        Args:
+            folders (list): The folders
+            counter (FsCounter): Counts the requests made
+
+        Returns:
+            None
+
+        Raises:
+            OSError: If a request fails
+        '''
+        client = self.connect()
+        for folder in folders:
+            key = f"{self.key(folder)}/"
+            if (key in self.known):
+                continue
+            if (counter):
+                counter.add("put")
+            try:
+                client.put_object(Bucket = self.bucket, Key = key, Body = b"")
+            except Exception as e:
+                raise OSError(f"Could not make {key} in {self.bucket}: {e}") from e
+            self.known.add(key)
+
+    def copy(self, src, dst, counter = None, cancelled = None, limiter = None, policy = COLLISION_POLICY):
+        '''
+        Uploads a file following a collision policy. The file is read once first for its hash and its ETag, and an
+        object that already has both the size and the ETag (or the same hash in its metadata) is left alone. With the
+        "version" policy an object is only created where none is, so two uploads cannot both take the same name.
+
+        Args:
+            src (str): The file being uploaded
+            dst (str): The path under DIR it goes to
+            counter (FsCounter): Counts the requests made
+            cancelled (threading.Event): Stops the upload between parts when set
+            limiter (RateLimiter): Caps the bytes per second sent, None for no cap
+            policy (str): What to do when dst is already taken, one of COLLISION_POLICIES
+
+        Returns:
+            tuple: (path, size, hash, action), action is "copied" or "skipped"
+
+        Raises:
+            ValueError: If the policy is not one of COLLISION_POLICIES
+            OSError: If a request fails
+        '''
+        if (policy not in COLLISION_POLICIES):
+            raise ValueError(f"Unknown collision policy {policy}")
+        self.connect()
+        size, file_hash, etag = self.fingerprint(src)
+
+        try:
+            if (policy != "version"):
+                if (self.matches(self.head(self.key(dst), counter), size, file_hash, etag)):
+                    return dst, size, file_hash, "skipped"
+                self.upload(src, self.key(dst), size, file_hash, counter, cancelled, limiter)
+                return dst, size, file_hash, "copied"
+
+            stem, ext = os.path.splitext(dst)
+            version = 1
+            while True:
+                path = dst if version == 1 else f"{stem}_v{version}{ext}"
+                head = self.head(self.key(path), counter)
+                if (head is None):
+                    try:
+                        self.upload(src, self.key(path), size, file_hash, counter, cancelled, limiter, create = True)
+                        return path, size, file_hash, "copied"
+                    except Exception as e:
+                        if (s3ErrorCode(e) not in S3_CONFLICTS):
+                            raise
+                        # Another upload created it first, look at what it put there
+                        continue
+                if (self.matches(head, size, file_hash, etag)):
+                    return path, size, file_hash, "skipped"
+                version += 1
+        except (UploadCancelled, OSError):
+            raise
+        except Exception as e:
+            raise OSError(f"Could not upload {src} to {self.bucket}: {e}") from e
+
+    def fingerprint(self, src):
+        '''
+        Reads a file once for its size, its HASH_ALGORITHM hash and the ETag the object store gives it when it is
+        uploaded by this storage (the MD5, or the MD5 of the part MD5s and the part count for multipart uploads)
+
+        Args:
+            src (str): The file
+
+        Returns:
+            tuple: (size, hash, etag)
+        '''
+        hasher = hashlib.new(HASH_ALGORITHM)
+        whole = hashlib.md5(usedforsecurity = False)
+        part_digests = []
+        size = 0
+        with open(src, "rb") as file:
+            while True:
+                part = file.read(S3_PART_SIZE)
+                if (not part):
+                    break
+                hasher.update(part)
+                whole.update(part)
+                part_digests.append(hashlib.md5(part, usedforsecurity = False).digest())
+                size += len(part)
+
+        if (size < S3_MULTIPART):
+            return size, hasher.hexdigest(), whole.hexdigest()
+        parts = hashlib.md5(b"".join(part_digests), usedforsecurity = False).hexdigest()
+        return size, hasher.hexdigest(), f"{parts}-{len(part_digests)}"
+
+    def head(self, key, counter = None):
+        '''
+        Gets the size, ETag and metadata of an object
+
+        Args:
+            key (str): The object key
+            counter (FsCounter): Counts the requests made
+
+        Returns:
+            dict: The head_object response, None if there is no such object
+        '''
+        if (counter):
+            counter.add("stat")
+        try:
+            return self.client.head_object(Bucket = self.bucket, Key = key)
+        except Exception as e:
+            if (s3ErrorCode(e) in ("404", "NoSuchKey", "NotFound")):
+                return None
+            raise
+
+    def matches(self, head, size, file_hash, etag):
+        '''
+        Checks if an object holds the content of a file
+
+        Args:
+            head (dict): The head_object response, None if there is no object
+            size (int): The size of the file
+            file_hash (str): The hash of the file
+            etag (str): The ETag the file gets when this storage uploads it
+
+        Returns:
+            bool: True if the object has the same size and the same ETag or hash
+        '''
+        if (head is None or head["ContentLength"] != size):
+            return False
+        return head["ETag"].strip('"') == etag or head.get("Metadata", {}).get(HASH_ALGORITHM) == file_hash
+
+    def upload(self, src, key, size, file_hash, counter = None, cancelled = None, limiter = None, create = False):
+        '''
+        Sends a file as one object, in parts when it is S3_MULTIPART or bigger. The parts of one file are sent at the
+        same time on the part pool, a multipart upload that fails or is cancelled is aborted so no parts are kept.
+
+        Args:
+            src (str): The file
+            key (str): The object key
+            size (int): The size of the file
+            file_hash (str): The hash of the file, kept in the object metadata
+            counter (FsCounter): Counts the requests made
+            cancelled (threading.Event): Stops the upload between parts when set
+            limiter (RateLimiter): Caps the bytes per second sent, None for no cap
+            create (bool): Only create the object if there is none, the request fails with one of S3_CONFLICTS otherwise
+
+        Returns:
+            None
+        '''
+        condition = {"IfNoneMatch": "*"} if create else {}
+        metadata = {HASH_ALGORITHM: file_hash}
+        if (size < S3_MULTIPART):
+            with open(src, "rb") as file:
+                body = file.read()
+            if (limiter):
+                limiter.wait(size)
+            if (counter):
+                counter.add("put")
+            self.client.put_object(Bucket = self.bucket, Key = key, Body = body, Metadata = metadata, **condition)
+            return
+
+        if (counter):
+            counter.add("put", 2 + (size + S3_PART_SIZE - 1) // S3_PART_SIZE)
+        upload_id = self.client.create_multipart_upload(Bucket = self.bucket, Key = key, Metadata = metadata)["UploadId"]
+        futures = []
+        try:
+            for number, offset in enumerate(range(0, size, S3_PART_SIZE), start = 1):
+                futures.append(self.pool.submit(self.uploadPart, src, key, upload_id, number, offset, cancelled, limiter))
+            parts = [future.result() for future in futures]
+            self.client.complete_multipart_upload(
+                Bucket = self.bucket, Key = key, UploadId = upload_id, MultipartUpload = {"Parts": parts}, **condition
+            )
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            try:
+                self.client.abort_multipart_upload(Bucket = self.bucket, Key = key, UploadId = upload_id)
+            except Exception as e:
+                log.warning(f"Could not abort the multipart upload of {key}: {e}")
+            raise
+
+    def uploadPart(self, src, key, upload_id, number, offset, cancelled = None, limiter = None):
+        '''
+        Sends one part of a multipart upload, runs on the part pool
+
+        Args:
+            src (str): The file
+            key (str): The object key
+            upload_id (str): The multipart upload
+            number (int): The part number, counting from 1
+            offset (int): Where the part starts in the file
+            cancelled (threading.Event): Stops the upload when set
+            limiter (RateLimiter): Caps the bytes per second sent, None for no cap
+
+        Returns:
+            dict: The part number and ETag for complete_multipart_upload
+        '''
+        if (cancelled and cancelled.is_set()):
+            raise UploadCancelled(src)
+        with open(src, "rb") as file:
+            file.seek(offset)
+            body = file.read(S3_PART_SIZE)
+        if (limiter):
+            limiter.wait(len(body))
+        response = self.client.upload_part(
+            Bucket = self.bucket, Key = key, UploadId = upload_id, PartNumber = number, Body = body
+        )
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def updateManifest(self, manifest_path, header, entries, counter = None):
+        '''
+        Adds entries to a manifest object, entries already in it for the same paths are replaced. The object is only
+        replaced if nobody changed it since it was read, otherwise it is read again.
+
+        Args:
+            manifest_path (str): The manifest.json path under DIR
+            header (dict): The manifest fields besides "files"
+            entries (dict): The new file entries by path
+            counter (FsCounter): Counts the requests made
+
+        Returns:
+            None
+
+        Raises:
+            TimeoutError: If the manifest kept changing for LOCK_TIMEOUT seconds
+            OSError: If a request fails
+        '''
+        client = self.connect()
+        key = self.key(manifest_path)
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        try:
+            while True:
+                if (counter):
+                    counter.add("read")
+                try:
+                    response = client.get_object(Bucket = self.bucket, Key = key)
+                    files = json.load(response["Body"]).get("files", [])
+                    condition = {"IfMatch": response["ETag"]}
+                except Exception as e:
+                    if (s3ErrorCode(e) != "NoSuchKey"):
+                        raise
+                    files = []
+                    condition = {"IfNoneMatch": "*"}
+
+                files = {entry["path"]: entry for entry in files}
+                files.update(entries)
+                manifest = {**header, "files": sorted(files.values(), key = lambda entry: entry["path"])}
+                if (counter):
+                    counter.add("write")
+                try:
+                    client.put_object(
+                        Bucket = self.bucket, Key = key, Body = json.dumps(manifest, indent = 4).encode("utf-8"),
+                        ContentType = "application/json", **condition
+                    )
+                    return
+                except Exception as e:
+                    if (s3ErrorCode(e) not in S3_CONFLICTS):
+                        raise
+                    if (time.monotonic() > deadline):
+                        raise TimeoutError(f"Could not update {key}, it kept changing")
+                    time.sleep(random.uniform(0.01, 0.05))
+        except (TimeoutError, OSError):
+            raise
+        except Exception as e:
+            raise OSError(f"Could not update {key} in {self.bucket}: {e}") from e
+
+def s3ErrorCode(error):
+    '''
+    Gets the error code of a failed object store request
+
+    Args:
+        error (Exception): The exception raised by the request
+
+    Returns:
+        str: The code like "NoSuchKey" or "412", None for an exception that is not from the object store
+    '''
+    return getattr(error, "response", {}).get("Error", {}).get("Code")
+
+def makeStorage(kind = STORAGE_TYPE, bucket = S3_BUCKET, prefix = S3_PREFIX, endpoint = S3_ENDPOINT):
+    '''
+    Makes the storage uploads are written to
+
+    Args:
+        kind (str): One of STORAGE_TYPES
+        bucket (str): The bucket for "s3"
+        prefix (str): Put in front of every key for "s3"
+        endpoint (str): The endpoint url for "s3", None for AWS
+
+    Returns:
+        LocalStorage or S3Storage: The storage
+
+    Raises:
+        ValueError: If kind is not one of STORAGE_TYPES
+    '''
+    if (kind == "local"):
+        return LocalStorage()
+    if (kind == "s3"):
+        return S3Storage(bucket, prefix, endpoint)
+    raise ValueError(f"Unknown storage {kind}")
+
+STORAGE = makeStorage()
+
+#############################################################
+# History Index
+#############################################################
+class HistoryIndex:
+    '''
+    SQLite index of the tool -> work order -> file tree under DIR. Paths are stored relative to the root with "/"
+    between folders. A folder whose mtime is NULL has changed and is listed again on the next refresh. File names are
+    split into lower case words and every suffix of every word is kept in name_terms, so a search for any part of a
+    name is a range lookup instead of a scan of every file. tool_summary keeps the totals of every tool, recounted
+    from files when an upload is recorded or once a refresh found something under the tool changed (stale).
+
+    Args:
+        path (str): The database file
+        root (str): The folder being indexed, defaults to DIR at the time of each call
+
+    Returns:
+        None
+    '''
+    def __init__(self, path = INDEX_PATH, root = None):
+        self.path = path
+        self.root = root
+        self.checked = False
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Opens the database and commits everything done in the with block as one transaction
+
+        Args:
+            None
+
+        Returns:
+            sqlite3.Connection: The open connection
+        '''
+        db = sqlite3.connect(self.path, timeout = 30)
+        try:
+            if (not self.checked):
+                self.createTables(db)
+                self.checked = True
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def createTables(self, db):
+        '''
+        Creates the tables, an index made by another version is dropped and has to be refreshed again
+
+        Args:
+            db (sqlite3.Connection): The open connection
+
+        Returns:
+            None
+        '''
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if (version != INDEX_VERSION):
+            if (version):
+                log.info(f"History index version {version} is out of date, it will be rebuilt on the next refresh")
+            db.execute("DROP TABLE IF EXISTS dirs")
+            db.execute("DROP TABLE IF EXISTS files")
+            db.execute("DROP TABLE IF EXISTS name_terms")
+            db.execute("DROP TABLE IF EXISTS tool_summary")
+
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime REAL
+            );
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                tool TEXT,
+                work_order TEXT,
+                name TEXT NOT NULL,
+                size INTEGER,
+                mtime REAL,
+                hash TEXT,
+                order_type INTEGER,
+                uploaded REAL
+            );
+            CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+            CREATE INDEX IF NOT EXISTS files_tool ON files (tool, work_order);
+            CREATE INDEX IF NOT EXISTS files_hash ON files (tool, hash);
+            CREATE INDEX IF NOT EXISTS files_name ON files (name);
+            CREATE INDEX IF NOT EXISTS files_uploaded ON files (uploaded);
+
+            CREATE TABLE IF NOT EXISTS name_terms (
+                term TEXT NOT NULL,
+                name TEXT NOT NULL,
+                PRIMARY KEY (term, name)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS tool_summary (
+                tool TEXT PRIMARY KEY,
+                files INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                work_orders INTEGER NOT NULL,
+                last_upload REAL,
+                last_user TEXT,
+                stale INTEGER NOT NULL DEFAULT 0
+            );
+        ''')
+        db.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        db.commit()
+
+    def getRoot(self):
+        '''
+        Gets the folder being indexed
+
+        Args:
+            None
+
+        Returns:
+            str: The indexed folder
+        '''
+        return self.root or DIR
+
+    def relative(self, path):
+        '''
+        Turns a full path under the root into the form stored in the index
+
+        Args:
+            path (str): The full path
+
+        Returns:
+            str: The path relative to the root, with "/" between folders
+        '''
+        rel = os.path.relpath(path, self.getRoot())
+        return "" if rel == "." else rel.replace(os.sep, "/")
+
+    def full(self, rel):
+        '''
+        Turns an indexed path back into a full path
+
+        Args:
+            rel (str): The path relative to the root
+
+        Returns:
+            str: The full path
+        '''
+        if (not rel):
+            return self.getRoot()
+        return os.path.join(self.getRoot(), *rel.split("/"))
+
+    def recordUpload(self, copied, order_type = None, user = None):
+        '''
+        Adds the files of an upload to the index in one transaction, and recounts the summaries of their tools
+
+        Args:
+            copied (list): CopyResult for every copied file
+            order_type (int): The order type of the upload, None if it is not known
+            user (str): Who uploaded the files, None if it is not known
+
+        Returns:
+            None
+        '''
+        uploaded = time.time()
+        tools = set()
+        with self.transaction() as db:
+            for result in copied:
+                rel = self.relative(result.path)
+                folder, _, name = rel.rpartition("/")
+                self.addParents(db, folder)
+                # The folder changed under us, list it again on the next refresh to catch anything else in it
+                db.execute("UPDATE dirs SET mtime = NULL WHERE path = ?", (folder,))
+                db.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (rel, folder, *splitHistoryPath(rel), name, result.size, result.mtime, result.hash,
+                     order_type or guessOrderType(rel), uploaded)
+                )
+                self.addTerms(db, [name])
+                tools.add(splitHistoryPath(rel)[0])
+
+            tools.discard(None)
+            self.summarize(db, tools)
+            if (user):
+                db.executemany("UPDATE tool_summary SET last_user = ? WHERE tool = ?", [(user, tool) for tool in tools])
+
+    def summarize(self, db, tools):
+        '''
+        Recounts the summaries of tools from the indexed files and folders
+
+        Args:
+            db (sqlite3.Connection): The open connection
+            tools (iterable): The tool numbers
+
+        Returns:
+            None
+        '''
+        for tool in tools:
+            files, size, last_upload = db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), MAX(uploaded) FROM files WHERE tool = ?", (tool,)
+            ).fetchone()
+            parents = [f"{tool}/{folder}" for folder in WO_FOLDERS]
+            work_orders = len({
+                row[0].rpartition("/")[2] for row in db.execute(
+                    f"SELECT path FROM dirs WHERE parent IN ({', '.join('?' * len(parents))})", parents
+                )
+            })
+            db.execute(
+                "INSERT INTO tool_summary (tool, files, bytes, work_orders, last_upload, stale) VALUES (?, ?, ?, ?, ?, 0) "
+                "ON CONFLICT (tool) DO UPDATE SET files = excluded.files, bytes = excluded.bytes, "
+                "work_orders = excluded.work_orders, last_upload = excluded.last_upload, stale = 0",
+                (tool, files, size, work_orders, last_upload)
+            )
+
+    def markStale(self, db, rel):
+        '''
+        Marks the summary of the tool a folder is in to be recounted
+
+        Args:
+            db (sqlite3.Connection): The open connection
+            rel (str): The folder relative to the root
+
+        Returns:
+            None
+        '''
+        tool = rel.partition("/")[0]
+        if (tool):
+            db.execute("UPDATE tool_summary SET stale = 1 WHERE tool = ?", (tool,))
+
+    def summaries(self, since = None):
+        '''
+        Lists the summary of every tool, the stale ones and tools without one yet are recounted first
+
+        Args:
+            since (float): Only tools with an upload at or after this timestamp
+
+        Returns:
+            list: ToolSummary for every tool, by tool number
+        '''
+        with self.transaction() as db:
+            recount = [row[0] for row in db.execute(
+                "SELECT path FROM dirs WHERE parent = '' AND path NOT IN (SELECT tool FROM tool_summary WHERE stale = 0)"
+            )]
+            self.summarize(db, recount)
+            query = "SELECT tool, files, bytes, work_orders, last_upload, last_user FROM tool_summary"
+            values = []
+            if (since is not None):
+                query += " WHERE last_upload >= ?"
+                values.append(since)
+            return [ToolSummary(*row) for row in db.execute(f"{query} ORDER BY tool", values)]
+
+    def addTerms(self, db, names, known = None):
+        '''
+        Adds the search terms of file names to the index
+
+        Args:
+            db (sqlite3.Connection): The open connection
+            names (list): The file names
+            known (set): Names whose terms are already in the index, the new names are added to it
+
+        Returns:
+            None
+        '''
+        rows = []
+        for name in names:
+            if (known is not None):
+                if (name in known):
+                    continue
+                known.add(name)
+            rows += [(term, name) for term in nameTerms(name)]
+        db.executemany("INSERT OR IGNORE INTO name_terms VALUES (?, ?)", rows)
+
+    def addParents(self, db, folder):
+        '''
+        Makes sure a folder and every folder above it are in the index
+
+        Args:
+            db (sqlite3.Connection): The open connection
+            folder (str): The path relative to the root
+
+        Returns:
+            None
+        '''
+        while True:
+            parent = folder.rpartition("/")[0]
+            db.execute("INSERT OR IGNORE INTO dirs VALUES (?, ?, NULL)", (folder, parent if folder else None))
+            if (not folder):
+                return
+            folder = parent
+
+    def refresh(self, workers = INDEX_WORKERS):
+        '''
+        Brings the index up to date with the tree. Only folders whose mtime changed since the last refresh are
+        listed again, every other folder costs a single stat. With object storage there is no tree to walk and
+        nothing is done. Folders are checked and listed on a pool of threads
+        while this thread writes to the database, which is what makes building an empty index bearable.
+
+        Args:
+            workers (int): The number of folders checked at the same time
+
+        Returns:
+            dict: The number of folders checked and listed
+        '''
+        summary = {"checked": 0, "listed": 0}
+        if (self.root is None and not STORAGE.local):
+            # DIR is not where the uploads are, walking it would drop every upload the index has as missing
+            log.info(f"Uploads go to {STORAGE.location()}, the index is only kept up to date by uploads")
+            return summary
+        with self.transaction() as db:
+            known = dict(db.execute("SELECT path, mtime FROM dirs"))
+            children = {}
+            for path, parent in db.execute("SELECT path, parent FROM dirs WHERE parent IS NOT NULL"):
+                children.setdefault(parent, []).append(path)
+            termed = {row[0] for row in db.execute("SELECT DISTINCT name FROM name_terms")}
+
+            def visit(rel):
+                # Runs on the pool, only touches the disk
+                try:
+                    mtime = os.stat(self.full(rel)).st_mtime
+                    if (rel in known and known[rel] == mtime):
+                        return rel, mtime, None
+                    return rel, mtime, self.scanFolder(rel)
+                except FileNotFoundError:
+                    return rel, None, None
+
+            with ThreadPoolExecutor(max_workers = max(1, workers)) as pool:
+                pending = {pool.submit(visit, "")}
+                while pending:
+                    done, pending = wait(pending, return_when = FIRST_COMPLETED)
+                    for future in done:
+                        rel, mtime, listing = future.result()
+                        summary["checked"] += 1
+                        if (mtime is None):
+                            self.forget(db, rel)
+                            continue
+                        if (listing is None):
+                            folders = children.get(rel, [])
+                        else:
+                            summary["listed"] += 1
+                            folders = self.storeFolder(db, rel, mtime, listing, children.get(rel, []), termed)
+                        pending |= {pool.submit(visit, folder) for folder in folders}
+            self.summarize(db, [row[0] for row in db.execute("SELECT tool FROM tool_summary WHERE stale = 1")])
+        return summary
+
+    def scanFolder(self, rel):
+        '''
+        Lists one folder on disk
+
+        Args:
+            rel (str): The folder relative to the root
+
+        Returns:
+            tuple: (folders, files), folders holds the sub folders relative to the root and files holds
+                   (path, name, size, mtime) for every file
+        '''
+        folders = []
+        files = []
+        with os.scandir(self.full(rel)) as entries:
+            for entry in entries:
+                child = f"{rel}/{entry.name}" if rel else entry.name
+                if (entry.is_dir()):
+                    folders.append(child)
+                elif (entry.is_file()):
+                    stat = entry.stat()
+                    files.append((child, entry.name, stat.st_size, stat.st_mtime))
+        return folders, files
+
+    def storeFolder(self, db, rel, mtime, listing, old_children, termed = None):
+        '''
+        Replaces the index entries of one folder with a listing from scanFolder
+
+        Args:
+            db (sqlite3.Connection): The open connection
+            rel (str): The folder relative to the root
+            mtime (float): The current mtime of the folder
+            listing (tuple): (folders, files) from scanFolder
+            old_children (list): The sub folders the index knew about
+            termed (set): Names whose terms are already in the index
+
+        Returns:
+            list: The sub folders that are on disk now
+        '''
+        folders, listed = listing
+        old_files = {
+            path: (size, file_mtime, file_hash, order_type, uploaded)
+            for path, size, file_mtime, file_hash, order_type, uploaded in db.execute(
+                "SELECT path, size, mtime, hash, order_type, uploaded FROM files WHERE dir = ?", (rel,)
+            )
+        }
+        files = []
+        for child, name, size, file_mtime in listed:
+            old = old_files.get(child)
+            # Keep a known hash as long as the file looks the same, and what the upload recorded about it
+            file_hash = old[2] if old and old[:2] == (size, file_mtime) else None
+            order_type = old[3] if old else guessOrderType(child)
+            uploaded = old[4] if old else file_mtime
+            files.append((child, rel, *splitHistoryPath(child), name, size, file_mtime, file_hash, order_type, uploaded))
+
+        for child in set(old_children) - set(folders):
+            self.forget(db, child)
+        self.markStale(db, rel)
+
+        db.execute("DELETE FROM files WHERE dir = ?", (rel,))
+        db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", files)
+        self.addTerms(db, [name for _, name, _, _ in listed], termed)
+        db.executemany("INSERT OR IGNORE INTO dirs VALUES (?, ?, NULL)", [(child, rel) for child in folders])
+        db.execute(
+            "INSERT INTO dirs VALUES (?, ?, ?) ON CONFLICT (path) DO UPDATE SET mtime = excluded.mtime",
+            (rel, rel.rpartition("/")[0] if rel else None, mtime)
+        )
+        return folders
+
+    def forget(self, db, rel):
+        '''
+        Removes a folder and everything under it from the index
+
+        Args:
+            db (sqlite3.Connection): The open connection
+            rel (str): The folder relative to the root
+
+        Returns:
+            None
+        '''
+        if (not rel):
+            db.execute("DELETE FROM dirs")
+            db.execute("DELETE FROM files")
+            db.execute("DELETE FROM tool_summary")
+            return
+        prefix = f"{rel}/"
+        db.execute("DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?", (rel, len(prefix), prefix))
+        db.execute("DELETE FROM files WHERE dir = ? OR substr(dir, 1, ?) = ?", (rel, len(prefix), prefix))
+        if ("/" in rel):
+            self.markStale(db, rel)
+        else:
+            db.execute("DELETE FROM tool_summary WHERE tool = ?", (rel,))
+
+    def invalidate(self, folders):
+        '''
+        Makes the next refresh list folders again whatever their mtime says. Used after changes that put the old
+        modified time back on a folder, which a refresh would otherwise take as unchanged.
+
+        Args:
+            folders (list): Full paths of the folders
+
+        Returns:
+            None
+        '''
+        with self.transaction() as db:
+            for folder in folders:
+                rel = self.relative(folder)
+                db.execute("UPDATE dirs SET mtime = NULL WHERE path = ?", (rel,))
+                self.markStale(db, rel)
+
+    def tools(self):
+        '''
+        Lists every tool in the index
+
+        Args:
+            None
+
+        Returns:
+            list: The tool numbers
+        '''
+        with self.transaction() as db:
+            return [row[0] for row in db.execute("SELECT path FROM dirs WHERE parent = '' ORDER BY path")]
+
+    def workOrders(self, tool):
+        '''
+        Lists the work orders of a tool
+
+        Args:
+            tool (str): The tool number
+
+        Returns:
+            list: The work order numbers
+        '''
+        parents = [f"{tool}/{folder}" for folder in WO_FOLDERS]
+        with self.transaction() as db:
+            rows = db.execute(
+                f"SELECT path FROM dirs WHERE parent IN ({', '.join('?' * len(parents))})", parents
+            )
+            return sorted({row[0].rpartition("/")[2] for row in rows})
+
+    def allWorkOrders(self):
+        '''
+        Lists the work orders of every tool
+
+        Args:
+            None
+
+        Returns:
+            list: (tool, work_order) for every work order folder
+        '''
+        pairs = []
+        with self.transaction() as db:
+            for folder in WO_FOLDERS:
+                rows = db.execute(
+                    "SELECT order_dir.path FROM dirs AS tool_dir JOIN dirs AS order_dir "
+                    "ON order_dir.parent = tool_dir.path || '/' || ? WHERE tool_dir.parent = ''", (folder,)
+                )
+                pairs.extend((path.partition("/")[0], path.rpartition("/")[2]) for path, in rows)
+        return pairs
+
+    def files(self, tool, work_order = None):
+        '''
+        Lists the indexed files of a tool, or of one of its work orders
+
+        Args:
+            tool (str): The tool number
+            work_order (str): The work order number, None for every file of the tool
+
+        Returns:
+            list: (path, size, mtime, hash) with full paths
+        '''
+        with self.transaction() as db:
+            if (work_order is None):
+                rows = db.execute("SELECT path, size, mtime, hash FROM files WHERE tool = ? ORDER BY path", (tool,))
+            else:
+                rows = db.execute(
+                    "SELECT path, size, mtime, hash FROM files WHERE tool = ? AND work_order = ? ORDER BY path",
+                    (tool, work_order)
+                )
+            return [(self.full(path), size, mtime, file_hash) for path, size, mtime, file_hash in rows]
+
+    def search(self, tool = None, work_order = None, name = None, since = None, until = None, order_type = None, limit = None):
+        '''
+        Finds indexed files. Every filter that is given has to match.
+
+        Args:
+            tool (str): The tool number
+            work_order (str): The work order number
+            name (str): fnmatch pattern for the file name, not case sensitive. A name without * ? or [ matches any
+                        file name that contains it
+            since (float): Only files uploaded at or after this timestamp
+            until (float): Only files uploaded before this timestamp
+            order_type (int): The order type (3 is stock)
+            limit (int): The most results, None for all of them
+
+        Returns:
+            list: SearchResult for every match, newest upload first
+        '''
+        where = []
+        values = []
+        for column, value in (("tool", tool), ("work_order", work_order), ("order_type", order_type)):
+            if (value is not None):
+                where.append(f"files.{column} = ?")
+                values.append(value)
+        if (since is not None):
+            where.append("files.uploaded >= ?")
+            values.append(since)
+        if (until is not None):
+            where.append("files.uploaded < ?")
+            values.append(until)
+
+        join = ""
+        pattern = None
+        if (name):
+            pattern = name.lower() if any(char in name for char in "*?[") else f"*{name.lower()}*"
+            # Every run of letters and digits in the pattern is inside one word of a matching name, so the longest
+            # run narrows the search to the names with a word containing it
+            runs = re.findall(r"[a-z0-9]+", re.sub(r"\[[^\]]*\]", "*", pattern))
+            if (runs):
+                run = max(runs, key = len)
+                join = "JOIN (SELECT DISTINCT name FROM name_terms WHERE term >= ? AND term < ?) AS terms ON terms.name = files.name"
+                values = [run, f"{run}{{"] + values
+
+        query = (
+            f"SELECT files.path, files.tool, files.work_order, files.size, files.uploaded, files.order_type, files.hash "
+            f"FROM files {join} {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY files.uploaded DESC"
+        )
+        results = []
+        with self.transaction() as db:
+            for path, *row in db.execute(query, values):
+                if (pattern and not fnmatch.fnmatchcase(path.rpartition("/")[2].lower(), pattern)):
+                    continue
+                results.append(SearchResult(self.full(path), *row))
+                if (limit and len(results) >= limit):
+                    break
+        return results
+
+# A file found by HistoryIndex.search, path is the full path and uploaded a timestamp
+SearchResult = namedtuple("SearchResult", ["path", "tool", "work_order", "size", "uploaded", "order_type", "hash"])
+# The totals of one tool from HistoryIndex.summaries, last_upload is a timestamp and last_user who made that upload
+ToolSummary = namedtuple("ToolSummary", ["tool", "files", "bytes", "work_orders", "last_upload", "last_user"])
+
+def nameTerms(name):
+    '''
+    Gets the search terms of a file name, every suffix of every lower case word of letters and digits
+
+    Args:
+        name (str): The file name
+
+    Returns:
+        set: The terms
+    '''
+    return {word[start:] for word in re.findall(r"[a-z0-9]+", name.lower()) for start in range(len(word))}
+
+def guessOrderType(rel):
+    '''
+    Works out the order type of a file that was not recorded by an upload, stock files are in a STOCK ORDER folder
+
+    Args:
+        rel (str): The file path relative to DIR, with "/" between folders
+
+    Returns:
+        int: 3 for stock, None if it cannot be told
+    '''
+    return 3 if "/STOCK ORDER_" in rel else None
+
+def splitHistoryPath(rel):
+    '''
+    Works out the tool and work order an indexed file belongs to
+
+    Args:
+        rel (str): The file path relative to DIR, with "/" between folders
+
+    Returns:
+        tuple: (tool, work_order), work_order is None for files outside of a work order folder
+    '''
+    parts = rel.split("/")
+    tool = parts[0] if len(parts) > 1 else None
+    work_order = None
+    if (len(parts) > 3 and parts[1] in WO_FOLDERS):
+        work_order = parts[2]
+    return tool, work_order
+
+INDEX = HistoryIndex()
+
+def invalidateIndex(folders):
+    '''
+    Has INDEX list folders again on its next refresh, see HistoryIndex.invalidate. A failure is logged, the files
+    on the share are already right
+
+    Args:
+        folders (list): Full paths of the folders
+
+    Returns:
+        None
+    '''
+    if (INDEX):
+        try:
+            INDEX.invalidate(folders)
+        except sqlite3.Error as e:
+            log.error(f"Could not update the history index: {e}")
+
+#############################################################
+# Registry
+#############################################################
+class Registry:
+    '''
+    The known tool and work order numbers, kept in sorted lists so the numbers starting with what has been typed so far
+    are found with a binary search instead of a scan. load() builds new lists and swaps them in at once, so it can run
+    on a background thread while the window keeps reading the old ones.
+
+    Args:
+        index (HistoryIndex): Where the tools and work orders on the share come from, None for INDEX
+        csv_path (str): An ERP export with REGISTRY_COLUMNS, None for REGISTRY_CSV
+
+    Returns:
+        None
+    '''
+    def __init__(self, index = None, csv_path = None):
+        self.index = index
+        self.csv_path = csv_path
+        # tools, {tool: work orders}, every work order; all sorted
+        self.lists = ([], {}, [])
+        # Goes up by one with every load, None until the first one
+        self.version = None
+
+    def load(self):
+        '''
+        Reads the tools and work orders again from the index as it stands, plus the tool folders at the top of the
+        share, which is a single listing and catches tools made since the last index refresh
+
+        Args:
+            None
+
+        Returns:
+            int: The number of known tools
+        '''
+        index = self.index or INDEX
+        pairs = index.allWorkOrders()
+        tools = set(index.tools())
+        if (STORAGE.local):
+            try:
+                with os.scandir(index.getRoot()) as entries:
+                    tools.update(entry.name for entry in entries if entry.is_dir())
+            except OSError as e:
+                log.warning(f"Could not list the tools in {index.getRoot()}: {e}")
+        csv_path = self.csv_path or REGISTRY_CSV
+        if (csv_path):
+            try:
+                pairs.extend(self.readCsv(csv_path))
+            except (OSError, csv.Error, UnicodeDecodeError) as e:
+                log.warning(f"Could not read the tool list {csv_path}: {e}")
+
+        work_orders = {}
+        for tool, work_order in pairs:
+            tools.add(tool)
+            if (work_order):
+                work_orders.setdefault(tool, set()).add(work_order)
+        everything = sorted({work_order for orders in work_orders.values() for work_order in orders})
+        self.lists = (sorted(tools), {tool: sorted(orders) for tool, orders in work_orders.items()}, everything)
+        self.version = (self.version or 0) + 1
+        return len(tools)
+
+    def readCsv(self, csv_path):
+        '''
+        Reads the tool and work order columns of an ERP export, the headers are matched without case
+
+        Args:
+            csv_path (str): The CSV file
+
+        Returns:
+            list: (tool, work_order) for every row, work_order is None when the row has none
+        '''
+        tool_column, order_column = (column.lower() for column in REGISTRY_COLUMNS)
+        pairs = []
+        with open(csv_path, newline = "", encoding = "utf-8-sig") as file:
+            for row in csv.DictReader(file):
+                row = {(key or "").strip().lower(): (value or "").strip() for key, value in row.items()}
+                if (row.get(tool_column)):
+                    pairs.append((row[tool_column], row.get(order_column) or None))
+        return pairs
+
+    @staticmethod
+    def startingWith(items, prefix, limit):
+        '''
+        Finds the items of a sorted list that start with a prefix
+
+        Args:
+            items (list): The sorted strings
+            prefix (str): What has been typed
+            limit (int): The most items returned
+
+        Returns:
+            list: The matching items in order
+        '''
+        found = []
+        for position in range(bisect.bisect_left(items, prefix), len(items)):
+            if (len(found) >= limit or not items[position].startswith(prefix)):
+                break
+            found.append(items[position])
+        return found
+
+    @staticmethod
+    def contains(items, item):
+        '''
+        Checks if a sorted list holds an item
+
+        Args:
+            items (list): The sorted strings
+            item (str): The item
+
+        Returns:
+            bool: True if the item is in the list
+        '''
+        position = bisect.bisect_left(items, item)
+        return position < len(items) and items[position] == item
+
+    def suggestTools(self, prefix, limit = REGISTRY_SUGGESTIONS):
+        '''
+        Lists the known tools that start with what has been typed
+
+        Args:
+            prefix (str): The start of a tool number
+            limit (int): The most tools returned
+
+        Returns:
+            list: The tool numbers in order
+        '''
+        return self.startingWith(self.lists[0], prefix, limit)
+
+    def suggestWorkOrders(self, tool, prefix, limit = REGISTRY_SUGGESTIONS):
+        '''
+        Lists the known work orders that start with what has been typed, only the tool's own when it has any
+
+        Args:
+            tool (str): The tool number
+            prefix (str): The start of a work order number
+            limit (int): The most work orders returned
+
+        Returns:
+            list: The work order numbers in order
+        '''
+        _, work_orders, everything = self.lists
+        return self.startingWith(work_orders.get(tool) or everything, prefix, limit)
+
+    def toolStatus(self, tool):
+        '''
+        Checks a tool number against the known tools
+
+        Args:
+            tool (str): The tool number
+
+        Returns:
+            str: "known" if it is in the registry, "new" if it is not but has the normal format, otherwise "unusual"
+        '''
+        if (self.contains(self.lists[0], tool)):
+            return "known"
+        return "new" if checkTool(tool) else "unusual"
+
+    def workOrderStatus(self, tool, work_order):
+        '''
+        Checks a work order number against the known work orders of the tool
+
+        Args:
+            tool (str): The tool number
+            work_order (str): The work order number
+
+        Returns:
+            str: "known" if the tool has it, "new" if it does not but has the normal format, otherwise "unusual"
+        '''
+        if (self.contains(self.lists[1].get(tool, []), work_order)):
+            return "known"
+        return "new" if checkWorkOrder(work_order) else "unusual"
+
+#############################################################
+# Metrics
+#############################################################
+class Metrics:
+    '''
+    Collects wall time, bytes and filesystem calls per stage of an upload. Timings are kept in memory and added to
+    the daily histograms in metrics.db by save(), so recording one is cheap enough for the copy loop.
+
+    Args:
+        path (str): The metrics database
+
+    Returns:
+        None
+    '''
+    def __init__(self, path = METRICS_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    @contextmanager
+    def stage(self, name, counter = None):
+        '''
+        Times the with block as one run of a stage
+
+        Args:
+            name (str): The stage name
+            counter (FsCounter): The bytes and calls it gains during the block are added to the stage
+
+        Returns:
+            None
+        '''
+        start = time.perf_counter()
+        calls = counter.total() if counter else 0
+        written = counter.written if counter else 0
+        try:
+            yield
+        finally:
+            if (counter):
+                self.record(name, time.perf_counter() - start, counter.written - written, counter.total() - calls)
+            else:
+                self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds, size = 0, calls = 0):
+        '''
+        Records one run of a stage
+
+        Args:
+            name (str): The stage name
+            seconds (float): The wall time
+            size (int): The bytes moved
+            calls (int): The filesystem calls made
+
+        Returns:
+            None
+        '''
+        bucket = next((number for number, bound in enumerate(METRICS_BUCKETS) if seconds <= bound), len(METRICS_BUCKETS))
+        with self.lock:
+            stage = self.pending.setdefault(name, {"count": 0, "seconds": 0.0, "bytes": 0, "calls": 0, "buckets": {}})
+            stage["count"] += 1
+            stage["seconds"] += seconds
+            stage["bytes"] += size
+            stage["calls"] += calls
+            stage["buckets"][bucket] = stage["buckets"].get(bucket, 0) + 1
+
+    def connect(self):
+        '''
+        Opens the metrics database
+
+        Args:
+            None
+
+        Returns:
+            sqlite3.Connection: The open connection
+        '''
+        db = sqlite3.connect(self.path, timeout = 30)
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS stages (
+                day TEXT,
+                stage TEXT,
+                count INTEGER,
+                seconds REAL,
+                bytes INTEGER,
+                calls INTEGER,
+                PRIMARY KEY (day, stage)
+            );
+            CREATE TABLE IF NOT EXISTS histogram (
+                day TEXT,
+                stage TEXT,
+                bucket INTEGER,
+                count INTEGER,
+                PRIMARY KEY (day, stage, bucket)
+            );
+        ''')
+        return db
+
+    def save(self):
+        '''
+        Adds everything recorded since the last save to today's histograms and drops days past METRICS_DAYS
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if (not pending):
+            return
+
+        day = datetime.now().strftime("%Y-%m-%d")
+        oldest = datetime.fromtimestamp(time.time() - METRICS_DAYS * 24 * 60 * 60).strftime("%Y-%m-%d")
+        try:
+            db = self.connect()
+            try:
+                with db:
+                    for name, stage in pending.items():
+                        db.execute(
+                            '''INSERT INTO stages VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (day, stage) DO UPDATE SET
+                               count = count + excluded.count, seconds = seconds + excluded.seconds,
+                               bytes = bytes + excluded.bytes, calls = calls + excluded.calls''',
+                            (day, name, stage["count"], stage["seconds"], stage["bytes"], stage["calls"])
+                        )
+                        db.executemany(
+                            '''INSERT INTO histogram VALUES (?, ?, ?, ?) ON CONFLICT (day, stage, bucket) DO UPDATE SET
+                               count = count + excluded.count''',
+                            [(day, name, bucket, count) for bucket, count in stage["buckets"].items()]
+                        )
+                    db.execute("DELETE FROM stages WHERE day < ?", (oldest,))
+                    db.execute("DELETE FROM histogram WHERE day < ?", (oldest,))
+            finally:
+                db.close()
+        except sqlite3.Error as e:
+            log.warning(f"Could not save metrics: {e}")
+
+    def report(self, days = 7, daily = False):
+        '''
+        Summarises the stages over the last few days
+
+        Args:
+            days (int): The number of days, counting today
+            daily (bool): One row per stage per day instead of one per stage
+
+        Returns:
+            list: dicts with the stage (and day), runs, total seconds, p50/p90/p99 seconds, bytes, MB/s and calls per run
+        '''
+        since = datetime.fromtimestamp(time.time() - (days - 1) * 24 * 60 * 60).strftime("%Y-%m-%d")
+        group = "day, stage" if daily else "stage"
+        db = self.connect()
+        try:
+            totals = db.execute(
+                f"SELECT {group}, SUM(count), SUM(seconds), SUM(bytes), SUM(calls) FROM stages WHERE day >= ? GROUP BY {group} ORDER BY {group}",
+                (since,)
+            ).fetchall()
+            histograms = {}
+            for row in db.execute(
+                f"SELECT {group}, bucket, SUM(count) FROM histogram WHERE day >= ? GROUP BY {group}, bucket ORDER BY bucket",
+                (since,)
+            ):
+                histograms.setdefault(row[:-2], []).append(row[-2:])
+        finally:
+            db.close()
+
+        rows = []
+        for row in totals:
+            key = row[:-4]
+            count, seconds, size, calls = row[-4:]
+            entry = dict(zip(group.split(", "), key))
+            entry.update({
+                "runs": count,
+                "seconds": seconds,
+                "p50": self.percentile(histograms.get(key, []), count, 0.5),
+                "p90": self.percentile(histograms.get(key, []), count, 0.9),
+                "p99": self.percentile(histograms.get(key, []), count, 0.99),
+                "bytes": size,
+                "mb_per_s": size / seconds / (1024 * 1024) if size and seconds else None,
+                "calls_per_run": calls / count if count else 0
+            })
+            rows.append(entry)
+        return rows
+
+    def percentile(self, buckets, count, fraction):
+        '''
+        Estimates a percentile from a histogram as the upper bound of the bucket it falls in
+
+        Args:
+            buckets (list): (bucket, count) in bucket order
+            count (int): The number of runs
+            fraction (float): The percentile, 0.5 for the median
+
+        Returns:
+            float: The estimated seconds, None past the last bound
+        '''
+        seen = 0
+        for bucket, bucket_count in buckets:
+            seen += bucket_count
+            if (seen >= fraction * count):
+                return METRICS_BUCKETS[bucket] if bucket < len(METRICS_BUCKETS) else None
+        return None
+
+def printStats(days = 7, daily = False):
+    '''
+    Prints the stage metrics as a table
+
+    Args:
+        days (int): The number of days, counting today
+        daily (bool): One row per stage per day
+
+    Returns:
+        None
+    '''
+    def seconds(value):
+        return f"<={value:.3f}s" if value is not None else "slower"
+
+    rows = METRICS.report(days, daily)
+    if (not rows):
+        print(f"No uploads recorded in the last {days} days")
+        return
+
+    print(f"{'day':<11}" * daily + f"{'stage':<22}{'runs':>7}{'total s':>10}{'p50':>11}{'p90':>11}{'p99':>11}{'MB':>10}{'MB/s':>8}{'calls':>7}")
+    for row in rows:
+        rate = f"{row['mb_per_s']:.1f}" if row["mb_per_s"] is not None else "-"
+        print(
+            (f"{row['day']:<11}" if daily else "")
+            + f"{row['stage']:<22}{row['runs']:>7}{row['seconds']:>10.1f}{seconds(row['p50']):>11}{seconds(row['p90']):>11}"
+            + f"{seconds(row['p99']):>11}{row['bytes'] / (1024 * 1024):>10.1f}{rate:>8}{row['calls_per_run']:>7.1f}"
+        )
+
+METRICS = Metrics()
+
+#############################################################
+# Batch
+#############################################################
+def parseRecord(record):
+    '''
+    Reads one manifest record into upload arguments
+
+    Args:
+        record (dict): The decoded manifest line
+
+    Returns:
+        tuple: (tool, work_order, order_type, in_paths, out_paths)
+
+    Raises:
+        ValueError: If the record is missing values or has an unknown order type
+    '''
+    if (not isinstance(record, dict)):
+        raise ValueError("Record is not a JSON object")
+
+    tool = str(record.get("tool", "")).strip()
+    work_order = str(record.get("work_order", "")).strip()
+
+    order_type = record.get("order_type", 0)
+    if (isinstance(order_type, str)):
+        if (order_type.lower() not in ORDER_TYPES):
+            raise ValueError(f"Unknown order type {order_type}")
+        order_type = ORDER_TYPES[order_type.lower()]
+
+    in_paths = record.get("inside", [])
+    out_paths = record.get("outside", [])
+    if (isinstance(in_paths, str)):
+        in_paths = [in_paths]
+    if (isinstance(out_paths, str)):
+        out_paths = [out_paths]
+
+    if (not tool or not work_order):
+        raise ValueError("Tool or work order not filled in")
+    if (not in_paths and not out_paths and not record.get("repeat")):
+        raise ValueError("No inside or outside files")
+    return tool, work_order, order_type, in_paths, out_paths
+
+def runBatch(manifest, workers = UPLOAD_WORKERS, force = False, dedup = False, policy = COLLISION_POLICY):
+    '''
+    Uploads every record of a JSON lines manifest without a window. The manifest is read one line at a time,
+    records that fail are written to <manifest>.failed so they can be run again.
+
+    Each line looks like:
+        {"tool": "48213", "work_order": "12345678", "order_type": "stock", "inside": ["a.pdf"], "outside": ["b.step"]}
+
+    "repeat": true starts the work order from the tool's previous one, "force": true skips the number format checks.
+
+    Args:
+        manifest (str): The path to the manifest
+        workers (int): The number of copies that can run at the same time
+        force (bool): Accept tool and work order numbers that do not look normal
+        dedup (bool): Hard link files whose content is already under the tool
+        policy (str): What to do when a file name is already taken, one of COLLISION_POLICIES
+
+    Returns:
+        dict: The number of uploaded and failed records
+    '''
+    log = make_log()
+    user = getpass.getuser()
+    log.info(f"Batch upload of {manifest} started by {user}", extra = {"user": user})
+
+    engine = CopyEngine(workers = workers, dedup = dedup, policy = policy)
+    summary = {"uploaded": 0, "failed": 0}
+    failed_path = f"{manifest}.failed"
+    failed_file = None
+
+    with open(manifest, encoding = "utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if (not line.strip() or line.lstrip().startswith("#")):
+                continue
+
+            try:
+                record = json.loads(line)
+                tool, work_order, order_type, in_paths, out_paths = parseRecord(record)
+                if (not (force or record.get("force"))):
+                    if (not checkTool(tool)):
+                        raise ValueError(f"Tool({tool}) does not seem correct")
+                    if (not checkWorkOrder(work_order)):
+                        raise ValueError(f"Workorder({work_order}) does not seem correct, check length")
+
+                missing = [path for path in in_paths + out_paths if not os.path.isfile(path)]
+                if (missing):
+                    raise ValueError(f"Missing files: {', '.join(missing)}")
+
+                errors = uploadJob(
+                    tool, work_order, order_type, in_paths, out_paths, engine, bool(record.get("repeat")), user
+                )
+                if (errors):
+                    raise ValueError("; ".join(f"Could not copy {path}: {error}" for path, error in errors))
+            except Exception as e:
+                log.error(f"Line {number}: {e}")
+                summary["failed"] += 1
+                if (failed_file is None):
+                    failed_file = open(failed_path, "w", encoding = "utf-8")
+                failed_file.write(line if line.endswith("\n") else f"{line}\n")
+                continue
+
+            log.debug(f"Line {number}: uploaded {tool} {work_order}")
+            summary["uploaded"] += 1
+
+    if (failed_file):
+        failed_file.close()
+        log.info(f"Failed records written to {failed_path}")
+    log.info(f"Batch upload finished: {summary['uploaded']} uploaded, {summary['failed']} failed")
+    return summary
+
+#############################################################
+# Spool
+#############################################################
+def spoolJob(tool, work_order, order_type, in_paths, out_paths, repeat = False, dedup = False, user = None, stage = True,
+             spool = None):
+    '''
+    Queues an upload in the local spool, "drain" pushes it to the share later. The job is put together in
+    spool/.incoming and renamed into the spool when it is complete, so the drain never sees half of a job.
+
+    Args:
+        tool (str): The tool number
+        work_order (str): The work order number
+        order_type (int): The selected order type (3 is stock)
+        in_paths (list): The inside file paths
+        out_paths (list): The outside file paths
+        repeat (bool): Start the work order from the tool's previous work order
+        dedup (bool): Hard link files whose content is already under the tool
+        user (str): Who queued the upload
+        stage (bool): Copy the files into the spool, False only keeps their paths
+        spool (str): The spool folder, defaults to SPOOL_DIR
+
+    Returns:
+        str: The job id
+    '''
+    spool = spool or SPOOL_DIR
+    job_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+    incoming = os.path.join(spool, ".incoming", job_id)
+    os.makedirs(incoming)
+
+    def stageFiles(paths, side):
+        if (not stage):
+            return [os.path.abspath(path) for path in paths]
+        staged = []
+        for number, path in enumerate(paths):
+            # One folder per file keeps the original name, two files can share a name
+            folder = os.path.join(side, str(number))
+            os.makedirs(os.path.join(incoming, folder))
+            shutil.copy2(path, os.path.join(incoming, folder, os.path.basename(path)))
+            staged.append(os.path.join(folder, os.path.basename(path)))
+        return staged
+
+    try:
+        job = {
+            "tool": tool,
+            "work_order": work_order,
+            "order_type": order_type,
+            "inside": stageFiles(in_paths, "inside"),
+            "outside": stageFiles(out_paths, "outside"),
+            "repeat": repeat,
+            "dedup": dedup,
+            "user": user,
+            "queued": datetime.now().isoformat(timespec = "seconds"),
+            "attempts": 0,
+            "next_attempt": 0,
+            "errors": []
+        }
+        with open(os.path.join(incoming, "job.json"), "w", encoding = "utf-8") as file:
+            json.dump(job, file, indent = 4)
+        os.rename(incoming, os.path.join(spool, job_id))
+    except Exception:
+        shutil.rmtree(incoming, ignore_errors = True)
+        raise
+    return job_id
+
+class SpoolDrain:
+    '''
+    Pushes queued uploads from the spool to the share with retries, exponential backoff and a bounded number of jobs
+    at the same time. Only one drain should run per spool folder.
+
+    Args:
+        spool (str): The spool folder, defaults to SPOOL_DIR
+        workers (int): The number of jobs uploaded at the same time
+        copy_workers (int): The number of files copied at the same time within a job
+        rate (float): Caps the bytes per second written to the share across every job, None for no cap
+
+    Returns:
+        None
+    '''
+    def __init__(self, spool = None, workers = 2, copy_workers = UPLOAD_WORKERS, rate = None):
+        self.spool = spool or SPOOL_DIR
+        self.workers = max(1, workers)
+        self.copy_workers = copy_workers
+        self.limiter = RateLimiter(rate) if rate else None
+        self.active = os.path.join(self.spool, ".active")
+        self.failed = os.path.join(self.spool, "failed")
+        os.makedirs(self.active, exist_ok = True)
+        os.makedirs(self.failed, exist_ok = True)
+
+        # Jobs left active by a drain that stopped part way are put back in the queue
+        for job_id in os.listdir(self.active):
+            os.rename(os.path.join(self.active, job_id), os.path.join(self.spool, job_id))
+
+    def ready(self):
+        '''
+        Lists the queued jobs that are due, oldest first
+
+        Args:
+            None
+
+        Returns:
+            list: The job ids
+        '''
+        now = time.time()
+        jobs = []
+        for job_id in sorted(os.listdir(self.spool)):
+            job_path = os.path.join(self.spool, job_id, "job.json")
+            if (job_id.startswith(".") or job_id == "failed" or not os.path.isfile(job_path)):
+                continue
+            with open(job_path, encoding = "utf-8") as file:
+                if (json.load(file).get("next_attempt", 0) <= now):
+                    jobs.append(job_id)
+        return jobs
+
+    def drainOnce(self):
+        '''
+        Uploads every job that is due
+
+        Args:
+            None
+
+        Returns:
+            dict: The number of jobs uploaded, put back for a retry and given up on
+        '''
+        summary = {"uploaded": 0, "retry": 0, "failed": 0}
+        if (not STORAGE.available()):
+            # Nothing can succeed while the share is away, so no attempts are used up
+            log.warning(f"{STORAGE.location()} is not reachable, spooled uploads are waiting")
+            return summary
+
+        jobs = self.ready()
+        with ThreadPoolExecutor(max_workers = self.workers) as pool:
+            for result in pool.map(self.runJob, jobs):
+                summary[result] += 1
+        return summary
+
+    def runJob(self, job_id):
+        '''
+        Uploads one job. The job folder is moved to spool/.active while it runs and removed once it succeeds.
+
+        Args:
+            job_id (str): The job id
+
+        Returns:
+            str: "uploaded", "retry" or "failed"
+        '''
+        job_dir = os.path.join(self.active, job_id)
+        os.rename(os.path.join(self.spool, job_id), job_dir)
+        job_path = os.path.join(job_dir, "job.json")
+        with open(job_path, encoding = "utf-8") as file:
+            job = json.load(file)
+
+        # Staged files are stored relative to the job, referenced files are absolute
+        in_paths = [os.path.join(job_dir, path) for path in job["inside"]]
+        out_paths = [os.path.join(job_dir, path) for path in job["outside"]]
+
+        try:
+            engine = CopyEngine(workers = self.copy_workers, dedup = job.get("dedup", False), limiter = self.limiter)
+            errors = uploadJob(
+                job["tool"], job["work_order"], job["order_type"], in_paths, out_paths, engine,
+                job.get("repeat", False), job.get("user")
+            )
+            if (errors):
+                raise OSError("; ".join(f"Could not copy {path}: {error}" for path, error in errors))
+        except Exception as e:
+            job["attempts"] += 1
+            job["errors"].append(f"{datetime.now().isoformat(timespec = 'seconds')} {e}")
+            if (job["attempts"] >= SPOOL_RETRIES):
+                log.error(f"Spooled upload {job_id} ({job['tool']} {job['work_order']}) failed {job['attempts']} times, moved to {self.failed}: {e}")
+                self.saveJob(job_path, job)
+                os.rename(job_dir, os.path.join(self.failed, job_id))
+                return "failed"
+
+            # Doubled every attempt with some jitter, so jobs that failed together do not all come back together
+            delay = min(SPOOL_BACKOFF * 2 ** (job["attempts"] - 1), SPOOL_BACKOFF_MAX) * random.uniform(0.5, 1)
+            job["next_attempt"] = time.time() + delay
+            log.warning(f"Spooled upload {job_id} failed (attempt {job['attempts']}), retrying in {delay:.0f}s: {e}")
+            self.saveJob(job_path, job)
+            os.rename(job_dir, os.path.join(self.spool, job_id))
+            return "retry"
+
+        log.info(f"Spooled upload {job_id} ({job['tool']} {job['work_order']}) queued by {job.get('user')} uploaded")
+        shutil.rmtree(job_dir)
+        return "uploaded"
+
+    def saveJob(self, job_path, job):
+        '''
+        Writes a job back after an attempt
+
+        Args:
+            job_path (str): The job.json path
+            job (dict): The job
+
+        Returns:
+            None
+        '''
+        with open(job_path, "w", encoding = "utf-8") as file:
+            json.dump(job, file, indent = 4)
+
+    def run(self, interval = 10):
+        '''
+        Drains the spool until the process is stopped
+
+        Args:
+            interval (float): Seconds to wait between checks of the spool
+
+        Returns:
+            None
+        '''
+        log.info(f"Draining {self.spool} to {DIR}")
+        while True:
+            summary = self.drainOnce()
+            if (any(summary.values())):
+                log.info(f"Spool: {summary['uploaded']} uploaded, {summary['retry']} to retry, {summary['failed']} failed")
+            time.sleep(interval)
+
+#############################################################
+# Migrate
+#############################################################
+def migrateTool(tool, dry_run = False):
+    '''
+    Moves a tool's LEGACY_WO_FOLDER into its WO_FOLDER. A folder that is only on the legacy side is moved with one
+    rename, the files of folders both sides have are moved one at a time. A file whose name is already taken is
+    dropped when it holds the same content and kept as name_v2.ext otherwise, like an upload with the "version"
+    collision policy. Manifests follow their files, and the work order folders keep their modified times so
+    latestWorkOrder still picks the same previous work order.
+
+    Args:
+        tool (str): The tool number
+        dry_run (bool): Only count what would be moved
+
+    Returns:
+        dict: The number of folders moved whole, files moved, duplicates dropped and files kept under a new name
+    '''
+    tool_path = os.path.join(DIR, tool)
+    legacy = os.path.join(tool_path, LEGACY_WO_FOLDER)
+    canonical = os.path.join(tool_path, WO_FOLDER)
+    result = {"tool": tool, "folders": 0, "files": 0, "duplicates": 0, "versioned": 0}
+    # Paths relative to the tool folder of the files that did not keep their names
+    renamed = {}
+    if (not os.path.isdir(legacy)):
+        return result
+
+    def relative(path):
+        return os.path.relpath(path, tool_path).replace(os.sep, "/")
+
+    def mergeFile(src, dst):
+        size = os.stat(src).st_size
+        if (dry_run):
+            if (not os.path.lexists(dst)):
+                result["files"] += 1
+            elif (sameContent(dst, size, hashFile(src))):
+                result["duplicates"] += 1
+            else:
+                result["versioned"] += 1
+            return
+
+        if (placeNew(src, dst)):
+            result["files"] += 1
+            return
+        path, action = publishFile(src, dst, size, hashFile(src), "version")
+        if (action == "skipped"):
+            result["duplicates"] += 1
+        elif (path != dst):
+            result["versioned"] += 1
+        else:
+            result["files"] += 1
+        if (path != dst):
+            renamed[relative(src)] = relative(path)
+
+    def mergeManifest(src, dst):
+        if (dry_run):
+            return
+        with fileLock(dst):
+            try:
+                with open(dst, encoding = "utf-8") as file:
+                    manifest = json.load(file)
+            except FileNotFoundError:
+                os.replace(src, dst)
+                return
+            # The paths still name the legacy folder here, moveManifestPaths sorts them out once every file is moved
+            files = {entry["path"]: entry for entry in readManifest(src)}
+            files.update({entry["path"]: entry for entry in manifest.get("files", [])})
+            manifest["files"] = sorted(files.values(), key = lambda entry: entry["path"])
+            saveManifest(dst, manifest)
+        os.remove(src)
+
+    def mergeFolder(src, dst):
+        if (not os.path.lexists(dst)):
+            if (dry_run):
+                result["folders"] += 1
+                return
+            try:
+                os.replace(src, dst)
+                result["folders"] += 1
+                return
+            except OSError as e:
+                # Made by an upload since the check, the two folders are merged below instead
+                if (e.errno not in (errno.EEXIST, errno.ENOTEMPTY)):
+                    raise
+
+        with os.scandir(src) as entries:
+            entries = list(entries)
+        for entry in entries:
+            if (entry.is_dir(follow_symlinks = False)):
+                mergeFolder(entry.path, os.path.join(dst, entry.name))
+            elif (entry.name != MANIFEST_NAME):
+                mergeFile(entry.path, os.path.join(dst, entry.name))
+        if (any(entry.name == MANIFEST_NAME for entry in entries)):
+            mergeManifest(os.path.join(src, MANIFEST_NAME), os.path.join(dst, MANIFEST_NAME))
+        if (not dry_run):
+            os.rmdir(src)
+
+    # The later modified time of each work order folder, put back once the two sides are merged
+    times = {}
+    for folder in (canonical, legacy):
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if (entry.is_dir()):
+                        times[entry.name] = max(times.get(entry.name, 0), entry.stat().st_mtime)
+        except FileNotFoundError:
+            continue
+
+    mergeFolder(legacy, canonical)
+    if (dry_run):
+        return result
+
+    for name, mtime in times.items():
+        folder = os.path.join(canonical, name)
+        moveManifestPaths(os.path.join(folder, MANIFEST_NAME), renamed)
+        os.utime(folder, (mtime, mtime))
+    # The old modified times would hide the merged files from the next refresh
+    invalidateIndex([os.path.join(canonical, name) for name in times])
+    return result
+
+def moveManifestPaths(manifest_path, renamed):
+    '''
+    Points the entries of a manifest that name LEGACY_WO_FOLDER at WO_FOLDER. When an entry for the same file is
+    already there, that one is kept.
+
+    Args:
+        manifest_path (str): The manifest.json path
+        renamed (dict): New paths of the files that did not keep their names, both relative to the tool folder
+
+    Returns:
+        bool: True if the manifest was changed
+    '''
+    prefix = f"{LEGACY_WO_FOLDER}/"
+    # Most work orders have nothing to change, those are only read
+    if (not any(entry["path"].startswith(prefix) for entry in readManifest(manifest_path))):
+        return False
+
+    with fileLock(manifest_path):
+        with open(manifest_path, encoding = "utf-8") as file:
+            manifest = json.load(file)
+        files = {}
+        moved = []
+        for entry in manifest.get("files", []):
+            path = renamed.get(entry["path"], entry["path"])
+            if (path.startswith(prefix)):
+                path = f"{WO_FOLDER}/{path[len(prefix):]}"
+            if (path == entry["path"]):
+                files[path] = entry
+            else:
+                moved.append({**entry, "path": path})
+        for entry in moved:
+            files.setdefault(entry["path"], entry)
+        manifest["files"] = sorted(files.values(), key = lambda entry: entry["path"])
+        saveManifest(manifest_path, manifest)
+    return True
+
+def migrateLayout(tools = None, workers = MIGRATE_WORKERS, dry_run = False, checkpoint = MIGRATE_CHECKPOINT):
+    '''
+    Moves LEGACY_WO_FOLDER into WO_FOLDER for every tool, a number of tools at the same time. Each finished tool is
+    added to the checkpoint file and skipped by the next run, a dry run does not read or write it.
+
+    Args:
+        tools (list): The tools to migrate, None for every tool under DIR
+        workers (int): The number of tools migrated at the same time
+        dry_run (bool): Only report what would be moved
+        checkpoint (str): The checkpoint file, None to migrate every tool again
+
+    Returns:
+        dict: Totals over every tool, and the number of tools done, skipped and failed
+    '''
+    if (tools is None):
+        with os.scandir(DIR) as entries:
+            tools = sorted(entry.name for entry in entries if entry.is_dir())
+
+    done = set()
+    if (checkpoint and not dry_run):
+        try:
+            with open(checkpoint, encoding = "utf-8") as file:
+                done = {json.loads(line)["tool"] for line in file if line.strip()}
+        except FileNotFoundError:
+            pass
+
+    pending = [tool for tool in tools if tool not in done]
+    summary = {"done": 0, "skipped": len(tools) - len(pending), "failed": 0, "folders": 0, "files": 0, "duplicates": 0, "versioned": 0}
+    checkpoint_file = open(checkpoint, "a", encoding = "utf-8") if checkpoint and not dry_run else None
+    try:
+        with ThreadPoolExecutor(max_workers = max(1, workers)) as pool:
+            futures = {pool.submit(migrateTool, tool, dry_run): tool for tool in pending}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except (OSError, ValueError, TimeoutError) as e:
+                    log.error(f"Could not migrate {futures[future]}, it is tried again next run: {e}")
+                    summary["failed"] += 1
+                    continue
+
+                summary["done"] += 1
+                for key in ("folders", "files", "duplicates", "versioned"):
+                    summary[key] += result[key]
+                if (result["folders"] or result["files"] or result["duplicates"] or result["versioned"]):
+                    log.info(
+                        f"{'Would move' if dry_run else 'Moved'} {result['tool']}: {result['folders']} folder(s), "
+                        f"{result['files']} file(s), {result['duplicates']} duplicate(s), {result['versioned']} renamed",
+                        extra = {"tool": result["tool"], "files": result["files"]}
+                    )
+                if (checkpoint_file):
+                    checkpoint_file.write(json.dumps(result) + "\n")
+                    checkpoint_file.flush()
+    finally:
+        if (checkpoint_file):
+            checkpoint_file.close()
+    return summary
+
+#############################################################
+# Archive
+#############################################################
+def isArchived(folder):
+    '''
+    Checks if a work order folder has been packed into an archive
+
+    Args:
+        folder (str): The work order folder
+
+    Returns:
+        bool: True if the folder has an archive stub
+    '''
+    return os.path.isfile(os.path.join(folder, ARCHIVE_STUB))
+
+def readArchiveStub(folder):
+    '''
+    Reads the stub of an archived work order
+
+    Args:
+        folder (str): The work order folder
+
+    Returns:
+        dict: The stub, with the archive name and a "files" entry (path, size, mtime, hash) for every archived file
+    '''
+    with open(os.path.join(folder, ARCHIVE_STUB), encoding = "utf-8") as file:
+        return json.load(file)
+
+def archiveWorkOrder(folder, cutoff, dry_run = False):
+    '''
+    Packs a work order folder into ARCHIVE_NAME if nothing in it changed since cutoff. The zip is written and checked
+    before any file is removed, the files left in the folder are the zip and ARCHIVE_STUB. The folder keeps its modified
+    time, so the work order does not look recently used. Runs in an archive worker process.
+
+    Args:
+        folder (str): The work order folder
+        cutoff (float): Timestamp, a folder with anything modified after it is left alone
+        dry_run (bool): Only work out if the folder would be archived
+
+    Returns:
+        dict: folder, status ("archived", "would archive", "recent", "busy" or "archived before"), files and bytes
+              before, and archive bytes
+    '''
+    result = {"folder": folder, "status": "recent", "files": 0, "bytes": 0, "archive_bytes": 0}
+    if (isArchived(folder)):
+        result["status"] = "archived before"
+        return result
+
+    folder_mtime = os.stat(folder).st_mtime
+    files = []
+    for path, size in scanPaths([folder], include = (), exclude = ()):
+        name = os.path.basename(path)
+        if (re.search(r"\.(part|link|clone|tmp|lock|journal)$", name)):
+            # An upload is writing into the folder right now
+            result["status"] = "busy"
+            return result
+        stat = os.stat(path)
+        if (stat.st_mtime > cutoff):
+            return result
+        files.append((path, os.path.relpath(path, folder).replace(os.sep, "/"), stat))
+    if (folder_mtime > cutoff or not files):
+        return result
+
+    result["files"] = len(files)
+    result["bytes"] = sum(stat.st_size for _, _, stat in files)
+    if (dry_run):
+        result["status"] = "would archive"
+        return result
+
+    # Hashes come from the manifest where the upload recorded them
+    tool_path = os.path.dirname(os.path.dirname(folder))
+    hashes = {entry["path"]: entry.get("hash") for entry in readManifest(os.path.join(folder, MANIFEST_NAME))}
+
+    archive_path = os.path.join(folder, ARCHIVE_NAME)
+    temp_path = tempName(archive_path, "tmp")
+    try:
+        with zipfile.ZipFile(temp_path, "w", compression = zipfile.ZIP_DEFLATED, strict_timestamps = False) as archive:
+            for path, rel, stat in files:
+                archive.write(path, rel)
+        with zipfile.ZipFile(temp_path) as archive:
+            packed = {info.filename: info.file_size for info in archive.infolist()}
+            bad = archive.testzip()
+        if (bad or packed != {rel: stat.st_size for _, rel, stat in files}):
+            raise OSError(f"Archive of {folder} did not check out ({bad or 'sizes differ'})")
+        os.replace(temp_path, archive_path)
+    except BaseException:
+        if (os.path.exists(temp_path)):
+            os.remove(temp_path)
+        raise
+
+    stub = {
+        "archive": ARCHIVE_NAME,
+        "archived": datetime.now().isoformat(timespec = "seconds"),
+        "folder_mtime": folder_mtime,
+        "files": [
+            {
+                "path": rel,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "hash": hashes.get(os.path.relpath(path, tool_path).replace(os.sep, "/"))
+            }
+            for path, rel, stat in files
+        ]
+    }
+    stub_path = os.path.join(folder, ARCHIVE_STUB)
+    temp_path = tempName(stub_path, "tmp")
+    with open(temp_path, "w", encoding = "utf-8") as file:
+        json.dump(stub, file, indent = 4)
+    os.replace(temp_path, stub_path)
+
+    for path, rel, stat in files:
+        os.remove(path)
+    for path, folders, names in os.walk(folder, topdown = False):
+        if (path != folder and not names and not folders):
+            os.rmdir(path)
+    os.utime(folder, (folder_mtime, folder_mtime))
+
+    result["status"] = "archived"
+    result["archive_bytes"] = os.stat(archive_path).st_size
+    return result
+
+def restoreWorkOrder(folder):
+    '''
+    Unpacks an archived work order back into its folder, with the modified times the files had when they were packed,
+    then removes the archive and its stub
+
+    Args:
+        folder (str): The work order folder
+
+    Returns:
+        int: The number of files restored
+    '''
+    stub = readArchiveStub(folder)
+    archive_path = os.path.join(folder, stub["archive"])
+    with zipfile.ZipFile(archive_path) as archive:
+        for entry in stub["files"]:
+            extractArchived(archive, entry, os.path.join(folder, *entry["path"].split("/")))
+
+    os.remove(os.path.join(folder, ARCHIVE_STUB))
+    os.remove(archive_path)
+    os.utime(folder, (stub["folder_mtime"], stub["folder_mtime"]))
+    invalidateIndex([folder])
+    log.info(f"Restored {len(stub['files'])} file(s) of {folder}")
+    return len(stub["files"])
+
+def extractArchived(archive, entry, dst):
+    '''
+    Copies one file out of a work order archive, the zip's central directory lets it be read without unpacking the rest
+
+    Args:
+        archive (zipfile.ZipFile): The open archive
+        entry (dict): The file's entry in the archive stub
+        dst (str): Where the file goes
+
+    Returns:
+        str: dst
+    '''
+    os.makedirs(os.path.dirname(dst), exist_ok = True)
+    temp_path = tempName(dst, "part")
+    try:
+        with archive.open(entry["path"]) as fsrc, open(temp_path, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst, COPY_CHUNK)
+        os.utime(temp_path, (entry["mtime"], entry["mtime"]))
+        os.replace(temp_path, dst)
+    except BaseException:
+        if (os.path.exists(temp_path)):
+            os.remove(temp_path)
+        raise
+    return dst
+
+def archiveColdWorkOrders(months = ARCHIVE_MONTHS, tools = None, workers = ARCHIVE_WORKERS, dry_run = False):
+    '''
+    Archives every work order that has not been touched for a number of months, a bounded number at a time
+
+    Args:
+        months (int): How long a work order has to be untouched
+        tools (list): The tools to look through, None for every tool under DIR
+        workers (int): The number of work orders packed at the same time
+        dry_run (bool): Only report what would be archived
+
+    Returns:
+        dict: The number of work orders per status, and the bytes before and after archiving
+    '''
+    cutoff = time.time() - months * 30.44 * 24 * 60 * 60
+    if (tools is None):
+        with os.scandir(DIR) as entries:
+            tools = sorted(entry.name for entry in entries if entry.is_dir())
+
+    folders = []
+    for tool in tools:
+        for container in WO_FOLDERS:
+            try:
+                with os.scandir(os.path.join(DIR, tool, container)) as entries:
+                    folders += [entry.path for entry in entries if entry.is_dir()]
+            except FileNotFoundError:
+                continue
+
+    summary = {"bytes": 0, "archive_bytes": 0}
+    archived = []
+    with ProcessPoolExecutor(max_workers = max(1, workers)) as pool:
+        futures = {pool.submit(archiveWorkOrder, folder, cutoff, dry_run): folder for folder in folders}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                log.error(f"Could not archive {futures[future]}: {e}")
+                summary["failed"] = summary.get("failed", 0) + 1
+                continue
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+            if (result["status"] in ("archived", "would archive")):
+                summary["bytes"] += result["bytes"]
+                summary["archive_bytes"] += result["archive_bytes"]
+                if (result["status"] == "archived"):
+                    archived.append(result["folder"])
+                log.info(f"{result['status'].capitalize()} {result['folder']}: {result['files']} file(s)",
+                         extra = {"path": result["folder"], "files": result["files"], "bytes": result["bytes"]})
+    # Packing puts the old modified time back on each folder, so the index has to be told they changed. Done here and
+    # not in the packing processes, which may not have this process's INDEX
+    invalidateIndex(archived)
+    return summary
+
+#############################################################
+# Ingest
+#############################################################
+def routeFile(name):
+    '''
+    Finds the tool and work order in a file name
+
+    Args:
+        name (str): The file name
+
+    Returns:
+        tuple: (tool, work_order), None if the name does not have both in the normal format
+    '''
+    for match in INGEST_PATTERN.finditer(name):
+        tool, work_order = match.group("tool"), match.group("work_order")
+        if (checkTool(tool) and checkWorkOrder(work_order)):
+            return tool, work_order
+    return None
+
+class InboxWatcher:
+    '''
+    Waits for files to land in folders. On Linux the folders are watched with inotify, elsewhere (or with poll set, for
+    network folders whose changes inotify does not see) every wait simply lasts the whole timeout.
+
+    Args:
+        folders (list): The folders to watch
+        poll (bool): Do not use inotify
+
+    Returns:
+        None
+    '''
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self, folders, poll = False):
+        self.fd = None
+        if (poll or not sys.platform.startswith("linux")):
+            return
+        try:
+            libc = ctypes.CDLL(None, use_errno = True)
+            fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+            if (fd < 0):
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            for folder in folders:
+                if (libc.inotify_add_watch(fd, os.fsencode(folder), self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0):
+                    error = ctypes.get_errno()
+                    os.close(fd)
+                    raise OSError(error, f"Could not watch {folder}")
+            self.fd = fd
+        except (OSError, AttributeError) as e:
+            log.warning(f"inotify is not available, polling instead: {e}")
+
+    def wait(self, timeout):
+        '''
+        Waits until a file is written or moved into a watched folder, or the timeout passes
+
+        Args:
+            timeout (float): The most seconds to wait
+
+        Returns:
+            bool: True if something changed or the folders are polled, False if the timeout passed quietly
+        '''
+        if (self.fd is None):
+            time.sleep(timeout)
+            return True
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if (not ready):
+            return False
+        # The events only say that something changed, the inbox is listed again anyway
+        while True:
+            try:
+                if (not os.read(self.fd, 65536)):
+                    break
+            except BlockingIOError:
+                break
+        return True
+
+    def close(self):
+        '''
+        Stops watching
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        if (self.fd is not None):
+            os.close(self.fd)
+            self.fd = None
+
+class IngestService:
+    '''
+    Uploads files saved into an inbox folder, routed by the tool and work order in their names. Files are uploaded in
+    batches, one uploadJob per work order, and moved to <inbox>/processed/<date> once they are on the share. Files
+    whose names do not route, or that failed INGEST_RETRIES times, are moved to <inbox>/quarantine with the reason
+    added to quarantine/reasons.jsonl. Only one service should run per inbox.
+
+    Args:
+        inbox (str): The inbox folder
+        order_type (int): The order type used for every upload (3 is stock)
+        poll (bool): Poll the inbox instead of using inotify
+        workers (int): The number of files copied at the same time
+        dedup (bool): Hard link files whose content is already under the tool
+
+    Returns:
+        None
+    '''
+    def __init__(self, inbox, order_type = 0, poll = False, workers = UPLOAD_WORKERS, dedup = False):
+        self.inbox = inbox
+        self.inside = os.path.join(inbox, "inside")
+        self.processed = os.path.join(inbox, "processed")
+        self.quarantine = os.path.join(inbox, "quarantine")
+        for folder in (self.inside, self.processed, self.quarantine):
+            os.makedirs(folder, exist_ok = True)
+
+        self.order_type = order_type
+        self.engine = CopyEngine(workers = workers, dedup = dedup)
+        self.watcher = InboxWatcher([self.inbox, self.inside], poll)
+        self.failures = {}
+
+    def pending(self):
+        '''
+        Lists the files waiting in the inbox
+
+        Args:
+            None
+
+        Returns:
+            tuple: (settled, waiting), settled holds (path, side) for files ready to upload, at most INGEST_BATCH of
+                   them, and waiting is the number of files that are still changing
+        '''
+        settled = []
+        waiting = 0
+        now = time.time()
+        for folder, side in ((self.inside, "inside"), (self.inbox, "outside")):
+            with os.scandir(folder) as entries:
+                for entry in sorted(entries, key = lambda entry: entry.name):
+                    if (not entry.is_file() or any(fnmatch.fnmatch(entry.name, pattern) for pattern in SCAN_EXCLUDE)):
+                        continue
+                    if (now - entry.stat().st_mtime < INGEST_SETTLE):
+                        waiting += 1
+                    elif (len(settled) < INGEST_BATCH):
+                        settled.append((entry.path, side))
+        return settled, waiting
+
+    def ingestOnce(self):
+        '''
+        Uploads the settled files in the inbox, one batch
+
+        Args:
+            None
+
+        Returns:
+            dict: The number of files uploaded, quarantined, put back for a retry and still being written
+        '''
+        summary = {"uploaded": 0, "quarantined": 0, "retry": 0, "waiting": 0}
+        settled, summary["waiting"] = self.pending()
+        if (not settled):
+            return summary
+        if (not STORAGE.available()):
+            log.warning(f"{STORAGE.location()} is not reachable, {len(settled)} inbox files are waiting")
+            summary["retry"] = len(settled)
+            return summary
+
+        # One upload per work order
+        batches = {}
+        for path, side in settled:
+            route = routeFile(os.path.basename(path))
+            if (route is None):
+                self.quarantineFile(path, "No tool and work order in the file name")
+                summary["quarantined"] += 1
+                continue
+            batch = batches.setdefault(route, {"inside": [], "outside": []})
+            batch[side].append(path)
+
+        for (tool, work_order), batch in batches.items():
+            paths = batch["inside"] + batch["outside"]
+            try:
+                errors = uploadJob(
+                    tool, work_order, self.order_type, batch["inside"], batch["outside"], self.engine, user = "ingest"
+                )
+            except Exception as e:
+                errors = [(path, e) for path in paths]
+
+            failed = {path: error for path, error in errors}
+            for path in paths:
+                if (path not in failed):
+                    self.moveFile(path, os.path.join(self.processed, datetime.now().strftime("%Y-%m-%d")))
+                    self.failures.pop(path, None)
+                    summary["uploaded"] += 1
+                    continue
+
+                self.failures[path] = self.failures.get(path, 0) + 1
+                if (self.failures[path] >= INGEST_RETRIES):
+                    self.quarantineFile(path, f"Upload to {tool} {work_order} failed: {failed[path]}")
+                    self.failures.pop(path)
+                    summary["quarantined"] += 1
+                else:
+                    log.warning(f"Could not upload {path} to {tool} {work_order}, will retry: {failed[path]}")
+                    summary["retry"] += 1
+            log.info(f"Ingested {len(paths) - len(failed)} of {len(paths)} files into {tool} {work_order}",
+                     extra = {"tool": tool, "work_order": work_order, "files": len(paths) - len(failed)})
+        return summary
+
+    def moveFile(self, path, folder):
+        '''
+        Moves a file out of the inbox without replacing a file of the same name
+
+        Args:
+            path (str): The file
+            folder (str): Where it goes
+
+        Returns:
+            str: The new path
+        '''
+        os.makedirs(folder, exist_ok = True)
+        stem, ext = os.path.splitext(os.path.basename(path))
+        target = os.path.join(folder, stem + ext)
+        number = 1
+        while os.path.exists(target):
+            number += 1
+            target = os.path.join(folder, f"{stem}_{number}{ext}")
+        os.rename(path, target)
+        return target
+
+    def quarantineFile(self, path, reason):
+        '''
+        Sets a file aside for a person to look at
+
+        Args:
+            path (str): The file
+            reason (str): Why it could not be uploaded
+
+        Returns:
+            None
+        '''
+        target = self.moveFile(path, self.quarantine)
+        log.warning(f"Quarantined {path}: {reason}", extra = {"path": target})
+        record = {"time": datetime.now().isoformat(timespec = "seconds"), "file": os.path.basename(target), "reason": reason}
+        with open(os.path.join(self.quarantine, "reasons.jsonl"), "a", encoding = "utf-8") as file:
+            file.write(json.dumps(record) + "\n")
+
+    def run(self, interval = 10):
+        '''
+        Ingests files as they arrive until the process is stopped
+
+        Args:
+            interval (float): The most seconds between looks at the inbox
+
+        Returns:
+            None
+        '''
+        log.info(f"Ingesting {self.inbox} into {DIR}")
+        try:
+            while True:
+                summary = self.ingestOnce()
+                if (summary["uploaded"] or summary["quarantined"] or summary["retry"]):
+                    log.info(f"Inbox: {summary['uploaded']} uploaded, {summary['quarantined']} quarantined, "
+                             f"{summary['retry']} to retry, {summary['waiting']} still being written")
+                # A full batch means more files are queued, a file still being written is looked at again once it settles
+                if (summary["uploaded"] + summary["quarantined"] >= INGEST_BATCH):
+                    continue
+                self.watcher.wait(min(interval, INGEST_SETTLE) if summary["waiting"] else interval)
+        finally:
+            self.watcher.close()
+
+#############################################################
+# Logger
+#############################################################
+class JsonFormatter(logging.Formatter):
+    '''
+    Formats a log record as one line of JSON. Values passed with extra = {...} that are named in LOG_FIELDS are
+    written as their own keys.
+
+    Args:
+        logging.Formatter: The parent class
+
+    Returns:
+        None
+    '''
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec = "milliseconds"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "thread": record.threadName
+        }
+        for field in LOG_FIELDS:
+            if (getattr(record, field, None) is not None):
+                entry[field] = getattr(record, field)
+        if (record.exc_info):
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default = str)
+
+def make_log():
+    '''
+    Creates the log or allows for appending to the log. Records go through a queue to a listener thread that does
+    the writing, so logging never waits on the disk. Calling this again returns the same logger.
+
+    Args:
+        None
+
+    Returns:
+        logger (var): The pointer variable to log file.
+    '''
+    global log_listener
+    logger = logging.getLogger(LOG_NAME)
+
+    with log_lock:
+        if (log_listener is not None):
+            return logger
+
+        logger.setLevel(logging.DEBUG)
+        formatter = logging.Formatter(
+            fmt = "%(asctime)s: %(levelname)-8s %(message)s", datefmt = "%d/%m/%Y %H:%M:%S"
+        )
+
+        file_handler = RotatingFileHandler(
+            filename = LOG_PATH,
+            mode = 'a',
+            maxBytes = 1024 * 1024,
+            backupCount = 1,
+            encoding = "utf-8",
+            delay = True
+        )
+        file_handler.setFormatter(JsonFormatter())
+
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter)
+
+        log_queue = queue.Queue()
+        log_listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level = True)
+        log_listener.start()
+        logger.addHandler(QueueHandler(log_queue))
+        atexit.register(close_log)
+    return logger
+
+def close_log():
+    '''
+    Writes out every record still in the queue and closes the log files, make_log opens them again if needed
+
+    Args:
+        None
+
+    Returns:
+        None
+    '''
+    global log_listener
+    logger = logging.getLogger(LOG_NAME)
+
+    with log_lock:
+        if (log_listener is None):
+            return
+        log_listener.stop()
+        for handler in log_listener.handlers:
+            handler.close()
+        for handler in [handler for handler in logger.handlers if isinstance(handler, QueueHandler)]:
+            logger.removeHandler(handler)
+        log_listener = None
\ No newline at end of file
@@ -0,0 +1,1164 @@
+#!/bin/env python3
+
+'''
+The upload window. ProductionHistory.py only imports this when the window is opened, so the headless commands do
+not load customtkinter and tkinterdnd2.
+'''
+
+import os
+import time
+import queue
+import getpass
+import threading
+import customtkinter as ctk
+from tkinter import filedialog
+from tkinterdnd2 import TkinterDnD, DND_FILES
+from HistoryBackend import (
+    METRICS, REGISTRY_REFRESH, SCAN_BATCH, CopyEngine, Registry, UploadCancelled, close_log, make_log, scanPaths,
+    spoolJob, uploadJob
+)
+
+#############################################################
+# Main App
+#############################################################
+# ctk.set_appearance_mode("system")
+# ctk.set_appearance_mode("dark")
+ctk.set_appearance_mode("light")
+ctk.set_default_color_theme("blue")
+
+class App(ctk.CTk, TkinterDnD.DnDWrapper):
+    '''
+    Main app display window
+
+    Args:
+        ctk.CTk (class): The parent class derived from customtkinter
+        TkinterDnD.DnDWrapper: The parent class for the drag and drop
+        started (float): time.perf_counter() when the program started, the time until the window shows is logged
+
+    Returns:
+        None
+    '''
+    def __init__(self, *args, started = None, **kwargs):
+        super().__init__(*args, **kwargs)
+    
+        self.TkdndVersion = TkinterDnD._require(self)
+
+        self.user = getpass.getuser()
+        self.log = make_log()
+        self.log.info(f"App opened by {self.user}")
+
+        self.engine = None
+        self.upload_events = queue.Queue()
+        # The unusual tool and work order the user was warned about, uploading them again goes ahead
+        self.flagged = None
+
+        self.title("Production History Upload")
+        self.geometry("670x915")
+        self.resizable(False, False)
+        self.grid_rowconfigure(0, weight = 1)
+        self.grid_columnconfigure(0, weight = 1)
+
+        self.titleLabel = ctk.CTkLabel(self, text = "Production History", font = ("Roboto", 30))
+        self.titleLabel.grid(row = 0, column = 0, rowspan = 1, columnspan = 6, padx = 10, pady = 00, sticky = "nsew")
+
+        # Create inputs for tool# and work order number
+        self.tool_frame = ToolFrame(self)
+        self.tool_frame.grid(row = 1, column = 0, rowspan = 1, columnspan = 9, padx = 20, pady = 0, sticky = "nsew")
+
+        # Create Options
+        self.options_frame = OptionsFrame(self)
+        self.options_frame.grid(row = 2, column = 5, rowspan = 10, columnspan = 2, padx = 20, pady = 20, sticky = "nsew")
+
+        # Create File uploads
+        self.file_frame = FileFrame(self)
+        self.file_frame.grid(row = 2, column = 0, rowspan = 12, columnspan = 4, padx = 20, pady = 20, sticky = "nsew")
+
+        # Buttons
+        self.uploadButton = ctk.CTkButton(self, text = "Upload", command = self.upload)
+        self.uploadButton.grid(column = 5, row = 12, columnspan = 1, padx = 20, pady = 20, sticky = "nsew")
+
+        self.closeButton = ctk.CTkButton(self, text = "Close", command = self.close)
+        self.closeButton.grid(column = 5, row = 13, columnspan = 1, padx = 20, pady = 20, sticky = "nsew")
+
+        self.errorEntry = ctk.CTkEntry(self, placeholder_text = "Error:", text_color = "red", state = "disabled")
+        self.errorEntry.grid(column = 0, row = 14, columnspan = 6, padx = 20, pady = 20, sticky = "nsew")
+
+        self.progressBar = ctk.CTkProgressBar(self)
+        self.progressBar.grid(column = 0, row = 15, columnspan = 6, padx = 20, pady = (0, 20), sticky = "nsew")
+        self.progressBar.set(0)
+
+        self.started = started
+        self.bind("<Map>", self.windowShown, add = "+")
+
+#############################################################
+# App Functions (Button functions etc)
+#############################################################
+    def windowShown(self, event):
+        '''
+        Logs the time from the program starting to the window first showing, and keeps it in the metrics as "startup"
+
+        Args:
+            event (tkinter.Event): The map event, the children of the window send one too
+
+        Returns:
+            None
+        '''
+        if (event.widget is not self or self.started is None):
+            return
+        elapsed = time.perf_counter() - self.started
+        self.started = None
+        self.log.info(f"Window shown {elapsed * 1000:.0f} ms after start", extra = {"duration": elapsed, "user": self.user})
+        METRICS.record("startup", elapsed)
+        METRICS.save()
+
+    def upload(self):
+        '''
+        Gathers all of the users inputs, creates the folder structure, and places files accordingly
+
+        Args:
+            none
+
+        Returns:
+            none
+        '''
+        self.log.info("Uploading")
+        tool = self.tool_frame.toolEntry.get()
+        work_order = self.tool_frame.workOrderEntry.get()
+        self.tool_frame.tool.set(tool)
+        self.tool_frame.work_order.set(work_order)
+
+        with METRICS.stage("validate"):
+            if (not self.checkInputs(tool, work_order)):
+                return
+            if (self.options_frame.requiredCheck.get() == "no"):
+                print("Required files not uploaded")
+                self.updateError("Required files are not uploaded (check box)")
+                return
+            repeat = self.options_frame.repeat.get() == "yes"
+            # Repeat orders get their files from the previous work order, so new files are optional
+            if (not repeat and (len(self.file_frame.in_frame.paths) < 1 or len(self.file_frame.out_frame.paths) < 1)):
+                print("No files uploaded on either inside or outside")
+                self.updateError("No files were uploaded inside, outside, or both.")
+                return
+
+        self.log.debug("Checks done")
+
+        # The widgets are read here, the worker thread only gets plain values
+        order_type = self.options_frame.order_type.get()
+        in_paths = list(self.file_frame.in_frame.paths)
+        out_paths = list(self.file_frame.out_frame.paths)
+
+        dedup = self.options_frame.dedup.get() == "yes"
+        spool = self.options_frame.spool.get() == "yes"
+        self.engine = CopyEngine(progress = self.uploadProgress, dedup = dedup)
+        self.uploadButton.configure(state = "disabled")
+        self.closeButton.configure(text = "Cancel", command = self.cancelUpload)
+        self.progressBar.set(0)
+
+        worker = threading.Thread(
+            target = self.uploadWorker,
+            args = (tool, work_order, order_type, in_paths, out_paths, repeat, spool),
+            daemon = True
+        )
+        worker.start()
+        self.after(100, self.pollUpload)
+
+    def uploadWorker(self, tool, work_order, order_type, in_paths, out_paths, repeat, spool):
+        '''
+        Creates the folder structure and copies the files, runs on a worker thread so the window stays responsive
+
+        Args:
+            tool (str): The tool number
+            work_order (str): The work order number
+            order_type (int): The selected order type (3 is stock)
+            in_paths (list): The inside file paths
+            out_paths (list): The outside file paths
+            repeat (bool): Start the work order from the tool's previous work order
+            spool (bool): Queue the upload in the local spool instead of copying to the share now
+
+        Returns:
+            None
+        '''
+        try:
+            if (spool):
+                job_id = spoolJob(
+                    tool, work_order, order_type, in_paths, out_paths,
+                    repeat = repeat, dedup = self.engine.dedup, user = self.user
+                )
+                self.log.info(f"Upload of {tool} {work_order} queued as {job_id}")
+                self.upload_events.put(("done", []))
+                return
+
+            self.log.debug("Uploading")
+            errors = uploadJob(tool, work_order, order_type, in_paths, out_paths, self.engine, repeat, self.user)
+            self.upload_events.put(("done", errors))
+        except Exception as e:
+            self.upload_events.put(("error", e))
+
+    def uploadProgress(self, done, total, path, error):
+        '''
+        Called by the copy engine after every finished copy, the event is handed to the main thread
+
+        Args:
+            done (int): The number of finished copies
+            total (int): The number of copies in the upload
+            path (str): The source path of the copy that finished
+            error (Exception): Why the copy failed, None if it worked
+
+        Returns:
+            None
+        '''
+        self.upload_events.put(("progress", done, total, path, error))
+
+    def pollUpload(self):
+        '''
+        Applies the events sent by the upload worker to the window, reschedules itself with after() until the upload ends
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        while True:
+            try:
+                event = self.upload_events.get_nowait()
+            except queue.Empty:
+                break
+
+            if (event[0] == "progress"):
+                done, total, path, error = event[1:]
+                self.progressBar.set(done / total)
+                if (error):
+                    # A copy that failed on a missing folder is tried once more and marked copied if that works
+                    self.file_frame.setStatus(path, "failed")
+                    self.log.debug(f"Could not copy {os.path.basename(path)} ({done}/{total}): {error}")
+                else:
+                    self.file_frame.setStatus(path, "copied")
+                    self.log.debug(f"Copied {os.path.basename(path)} ({done}/{total})")
+            elif (event[0] == "done"):
+                self.finishUpload()
+                errors = event[1]
+                if (errors):
+                    for path, error in errors:
+                        self.file_frame.setStatus(path, "failed")
+                        self.log.error(f"Could not copy {path}: {error}")
+                    self.updateError(f"{len(errors)} file(s) failed to upload, check program.log")
+                    return
+                self.log.debug("Files uploaded")
+                self.destroy()
+                return
+            elif (event[0] == "error"):
+                self.finishUpload()
+                error = event[1]
+                if (isinstance(error, UploadCancelled)):
+                    self.log.info(f"Upload cancelled by {self.user}: {error}")
+                    self.updateError("Upload cancelled")
+                elif (isinstance(error, FileNotFoundError)):
+                    # A picked file was moved or deleted after it was added, the message names it
+                    self.log.error(f"Upload incomplete: {error}")
+                    self.updateError(str(error))
+                else:
+                    self.log.error(f"Upload failed: {error}")
+                    self.updateError("Upload failed, check program.log")
+                return
+
+        self.after(100, self.pollUpload)
+
+    def cancelUpload(self):
+        '''
+        Stops the running upload, copies that already started are allowed to finish
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        if (self.engine):
+            self.log.debug("Cancelling upload")
+            self.engine.cancel()
+
+    def finishUpload(self):
+        '''
+        Puts the buttons back after an upload ends
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        self.engine = None
+        self.uploadButton.configure(state = "normal")
+        self.closeButton.configure(text = "Close", command = self.close)
+
+    def checkInputs(self, tool, work_order):
+        '''
+        Checks to see if the tool and work order are normal. Numbers that are neither known nor in the normal format
+        are flagged in the error box instead of asking in a dialog, pressing Upload again with the same numbers uses them.
+
+        Args:
+            tool (str): The tool that was input
+            work_order (str): The work order that was input
+
+        Returns:
+            bool: True if the check passed and false if the check did not
+        '''
+        if (not tool or tool == "Null") or (not work_order or work_order == "Null"):
+            self.log.debug(f"Tool({tool}) or workorder({work_order}) not filled in")
+            self.updateError("Tool or Workorder is incorrect")
+            return False
+
+        registry = self.tool_frame.registry
+        unusual = []
+        if (registry.toolStatus(tool) == "unusual"):
+            unusual.append("Tool number")
+        if (registry.workOrderStatus(tool, work_order) == "unusual"):
+            unusual.append("Work order")
+        if (unusual and self.flagged != (tool, work_order)):
+            self.log.debug(f"Tool({tool}) or workorder({work_order}) does not seem correct")
+            self.flagged = (tool, work_order)
+            self.updateError(f"{' and '.join(unusual)} does not seem correct, press Upload again to use it anyway")
+            return False
+        if (unusual):
+            self.log.debug(f"Tool({tool}) and workorder({work_order}) confirmed")
+        self.flagged = None
+        return True
+
+    def updateError(self, message : str):
+        '''
+        Updates the error label with the given message
+
+        Args:
+            message (str): The message that will be displayed in the error box
+
+        Returns:
+            None
+        '''
+        self.errorEntry.configure(state = "normal")
+        self.errorEntry.delete("0", "end")
+        self.errorEntry.insert("0", message)
+        self.errorEntry.configure(state = "disabled")
+
+    def close(self):
+        '''
+        Closes the main window
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        self.log.debug(f"App closed by {self.user}")
+        self.tool_frame.stop()
+        METRICS.save()
+        close_log()
+        self.destroy()
+
+#############################################################
+# App Sections
+#############################################################
+# Tool and Work order
+class ToolFrame(ctk.CTkFrame):
+    '''
+    Sub class for the tool and work-order entry section. Known numbers are suggested while typing (Tab takes the first
+    one) and the hint under each entry says if the number is known, new or unusual. The registry behind it is loaded
+    and read again on a background thread, the window only picks up the new lists.
+
+    Args:
+        self (ctk.CTkFrame): The parent class
+
+    Returns:
+        None
+    '''
+    HINT_COLORS = {"known": "green", "typing": "gray", "new": "dark orange", "unusual": "red"}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.tool = ctk.StringVar(value = "Null")
+        self.work_order = ctk.StringVar(value = "Null")
+
+        self.toolEntry = ctk.CTkEntry(self, placeholder_text = "Tool #")
+        self.toolEntry.grid(column = 0, row = 0, padx = 40, pady = (20, 0))
+
+        self.workOrderEntry = ctk.CTkEntry(self, placeholder_text = "Work Order #", width = 200)
+        self.workOrderEntry.grid(column = 2, row = 0, columnspan = 2, padx = 40, pady = (20, 0))
+
+        self.toolHint = ctk.CTkLabel(self, text = "", text_color = "gray", wraplength = 200)
+        self.toolHint.grid(column = 0, row = 1, padx = 40, pady = (0, 10))
+
+        self.workOrderHint = ctk.CTkLabel(self, text = "", text_color = "gray", wraplength = 260)
+        self.workOrderHint.grid(column = 2, row = 1, columnspan = 2, padx = 40, pady = (0, 10))
+
+        for entry in (self.toolEntry, self.workOrderEntry):
+            entry.bind("<KeyRelease>", self.showHints, add = "+")
+            entry.bind("<Tab>", lambda event, entry = entry: self.complete(entry), add = "+")
+
+        self.registry = Registry()
+        self.registry_version = None
+        self.stopped = threading.Event()
+        threading.Thread(target = self.loadRegistry, daemon = True).start()
+        self.after(200, self.pollRegistry)
+
+    def loadRegistry(self):
+        '''
+        Loads the registry, then loads it again every REGISTRY_REFRESH seconds to pick up other uploads. Runs on a
+        background thread and never touches the widgets.
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        while True:
+            try:
+                self.registry.load()
+            except Exception as e:
+                self.master.log.warning(f"Could not load the tool registry: {e}")
+            if (REGISTRY_REFRESH is None or self.stopped.wait(REGISTRY_REFRESH)):
+                return
+
+    def pollRegistry(self):
+        '''
+        Shows the hints again when the background thread loaded new lists, reschedules itself with after()
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        if (self.registry.version != self.registry_version):
+            self.registry_version = self.registry.version
+            self.showHints()
+        if (not self.stopped.is_set()):
+            self.after(500, self.pollRegistry)
+
+    def stop(self):
+        '''
+        Stops the background loading
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        self.stopped.set()
+
+    def suggestions(self, entry):
+        '''
+        Lists the known numbers starting with what is typed in an entry
+
+        Args:
+            entry (ctk.CTkEntry): The tool or work order entry
+
+        Returns:
+            list: The suggested numbers
+        '''
+        typed = entry.get().strip()
+        if (entry is self.toolEntry):
+            return self.registry.suggestTools(typed)
+        return self.registry.suggestWorkOrders(self.toolEntry.get().strip(), typed)
+
+    def complete(self, entry):
+        '''
+        Fills in the first suggestion when Tab is pressed, Tab moves on as usual when there is nothing to fill in
+
+        Args:
+            entry (ctk.CTkEntry): The entry Tab was pressed in
+
+        Returns:
+            str: "break" to keep the focus in the entry after filling it in
+        '''
+        typed = entry.get().strip()
+        suggested = self.suggestions(entry)
+        if (not typed or not suggested or suggested[0] == typed):
+            return None
+        entry.delete(0, "end")
+        entry.insert(0, suggested[0])
+        self.showHints()
+        return "break"
+
+    def showHints(self, event = None):
+        '''
+        Updates the hints under both entries from the registry
+
+        Args:
+            event (tkinter.Event): The key event, unused
+
+        Returns:
+            None
+        '''
+        tool = self.toolEntry.get().strip()
+        work_order = self.workOrderEntry.get().strip()
+        loading = self.registry.version is None
+
+        if (not tool):
+            self.setHint(self.toolHint, "", "known")
+        else:
+            status = self.registry.toolStatus(tool)
+            # A number that is still being typed is not unusual yet while known numbers start with it, and nothing is
+            # new before the registry is loaded
+            if (status != "known" and (loading or status == "unusual" and self.suggestions(self.toolEntry))):
+                status = "typing"
+            messages = {
+                "known": "Known tool",
+                "typing": "Loading known tools..." if loading else "Known tools starting with this",
+                "new": "New tool, not in the history yet",
+                "unusual": "Tool numbers are 5 digits"
+            }
+            self.setHint(self.toolHint, self.withSuggestions(messages[status], self.toolEntry, tool), status)
+
+        if (not work_order):
+            self.setHint(self.workOrderHint, "", "known")
+        else:
+            status = self.registry.workOrderStatus(tool, work_order)
+            if (status != "known" and (loading or status == "unusual" and self.suggestions(self.workOrderEntry))):
+                status = "typing"
+            messages = {
+                "known": "Known work order of this tool",
+                "typing": "Loading known work orders..." if loading else "Known work orders starting with this",
+                "new": "New work order for this tool",
+                "unusual": "Work orders are 8 characters"
+            }
+            self.setHint(
+                self.workOrderHint, self.withSuggestions(messages[status], self.workOrderEntry, work_order), status
+            )
+
+    def withSuggestions(self, message, entry, typed):
+        '''
+        Adds the known numbers that start with what was typed to a hint
+
+        Args:
+            message (str): The hint
+            entry (ctk.CTkEntry): The entry the hint is for
+            typed (str): What is typed in the entry
+
+        Returns:
+            str: The hint with the suggestions, or the hint alone when there are none
+        '''
+        suggested = [number for number in self.suggestions(entry) if number != typed]
+        if (not suggested):
+            return message
+        return f"{message}\nTab: {', '.join(suggested)}"
+
+    def setHint(self, label, text, status):
+        '''
+        Shows a hint in the colour of its status
+
+        Args:
+            label (ctk.CTkLabel): The hint label
+            text (str): The hint
+            status (str): "known", "typing", "new" or "unusual"
+
+        Returns:
+            None
+        '''
+        label.configure(text = text, text_color = self.HINT_COLORS[status])
+
+# Options
+class OptionsFrame(ctk.CTkFrame):
+    '''
+    Sub class for the option selection section
+
+    Args:
+        self (ctk.CTkFrame): The parent class
+
+    Returns:
+        None
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.repeat = ctk.StringVar(value = "no")
+        self.dedup = ctk.StringVar(value = "no")
+        self.spool = ctk.StringVar(value = "no")
+        self.order_type = ctk.IntVar(value = 0)
+
+        self.typeCheck = ctk.CTkCheckBox(self, text = "Repeat", variable = self.repeat, onvalue = "yes", offvalue = "no")
+        self.typeCheck.grid(column = 0, row = 0, padx = 20, pady = 20, sticky = "nsew")
+
+        self.itarRadio = ctk.CTkRadioButton(self, text = "ITAR", variable = self.order_type, value = 1)
+        self.itarRadio.grid(column = 0, row = 1, padx = 20, pady = 20, sticky = "nsew")
+
+        self.nonItarRadio = ctk.CTkRadioButton(self, text = "Non-ITAR", variable = self.order_type, value = 2)
+        self.nonItarRadio.grid(column = 0, row = 2, padx = 20, pady = 20, sticky = "nsew")
+
+        self.stockRadio = ctk.CTkRadioButton(self, text = "Stock", variable = self.order_type, value = 3)
+        self.stockRadio.grid(column = 0, row = 3, padx = 20, pady = 20, sticky = "nsew")
+        
+        self.requiredCheck = ctk.CTkCheckBox(self, text = "Required Files", onvalue = "yes", offvalue = "no")
+        self.requiredCheck.grid(column = 0, row = 4, padx = 20, pady = 20, sticky = "nsew")
+
+        self.dedupCheck = ctk.CTkCheckBox(self, text = "Link Duplicates", variable = self.dedup, onvalue = "yes", offvalue = "no")
+        self.dedupCheck.grid(column = 0, row = 5, padx = 20, pady = 20, sticky = "nsew")
+
+        self.spoolCheck = ctk.CTkCheckBox(self, text = "Queue Upload", variable = self.spool, onvalue = "yes", offvalue = "no")
+        self.spoolCheck.grid(column = 0, row = 6, padx = 20, pady = 20, sticky = "nsew")
+
+        # self.required1Button = ctk.CTkButton(self, text = "Required 1", height = 40)
+        # self.required1Button.grid(column = 0, row = 4, padx = 20, pady = 20, sticky = "nsew")
+
+        # self.required2Button = ctk.CTkButton(self, text = "Required 2", height = 40)
+        # self.required2Button.grid(column = 0, row = 5, padx = 20, pady = 20, sticky = "nsew")
+
+# Files
+class FileList:
+    '''
+    The files picked for an upload, in the order they are shown. Kept apart from the widgets so adding, removing or
+    updating a file only touches that file and not the whole list.
+
+    Args:
+        None
+
+    Returns:
+        None
+    '''
+    def __init__(self):
+        self.rows = []
+        self.keys = set()
+        self.by_path = {}
+        self.size = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, paths, side, sizes = None):
+        '''
+        Adds files to the end of the list, a file already on the same side is left out
+
+        Args:
+            paths (list): The file paths
+            side (str): "inside" or "outside"
+            sizes (list): The size of each path when it is already known, otherwise each file is stat'd
+
+        Returns:
+            list: The FileRows that were added
+        '''
+        added = []
+        for number, path in enumerate(paths):
+            if (not path or (side, path) in self.keys):
+                continue
+            if (sizes):
+                size = sizes[number]
+            else:
+                try:
+                    size = os.stat(path).st_size
+                except OSError:
+                    size = None
+            row = FileRow(path, side, size)
+            self.rows.append(row)
+            self.keys.add((side, path))
+            self.by_path.setdefault(path, []).append(row)
+            self.size += size or 0
+            added.append(row)
+        return added
+
+    def remove(self, row):
+        '''
+        Takes a file out of the list
+
+        Args:
+            row (FileRow): The file to remove
+
+        Returns:
+            None
+        '''
+        self.rows.remove(row)
+        self.size -= row.size or 0
+        self.keys.discard((row.side, row.path))
+        self.by_path[row.path].remove(row)
+        if (not self.by_path[row.path]):
+            del self.by_path[row.path]
+
+    def clear(self):
+        '''
+        Empties the list
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        self.rows = []
+        self.keys = set()
+        self.by_path = {}
+        self.size = 0
+
+    def paths(self, side):
+        '''
+        Gets the paths on one side in the order they were added
+
+        Args:
+            side (str): "inside" or "outside"
+
+        Returns:
+            list: The file paths
+        '''
+        return [row.path for row in self.rows if row.side == side]
+
+    def setStatus(self, path, status):
+        '''
+        Sets the status of every row for a path
+
+        Args:
+            path (str): The file path
+            status (str): The new status
+
+        Returns:
+            list: The FileRows that changed
+        '''
+        rows = [row for row in self.by_path.get(path, []) if row.status != status]
+        for row in rows:
+            row.status = status
+        return rows
+
+class FileRow:
+    '''
+    One file in a FileList
+
+    Args:
+        path (str): The file path
+        side (str): "inside" or "outside"
+        size (int): The size in bytes, None if the file could not be read
+        status (str): "queued", "copied" or "failed"
+
+    Returns:
+        None
+    '''
+    def __init__(self, path, side, size = None, status = "queued"):
+        self.path = path
+        self.side = side
+        self.size = size
+        self.status = status
+
+def formatSize(size):
+    '''
+    Formats a byte count for the file display
+
+    Args:
+        size (int): The size in bytes, None if unknown
+
+    Returns:
+        str: The size with a unit
+    '''
+    if (size is None):
+        return "?"
+    for unit in ("B", "KB", "MB", "GB"):
+        if (size < 1024 or unit == "GB"):
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+class FileFrame(ctk.CTkFrame):
+    '''
+    Sub class for the File input and display section
+
+    Args:
+        ctk.CTkFrame: The parent class for the frame
+
+    Returns:
+        None
+    '''
+    # Start of each line in the display box
+    SIDE_LABELS = {"inside": "Inside            ", "outside": "Outside         "}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.file_list = FileList()
+        # Each row has a text mark at the start of its line, marks move with the text so rows are found without a search
+        self.marks = {}
+        self.next_mark = 0
+        # Dropped files and folders are searched one drop after the other on a worker thread, which sends batches of
+        # files back through scan_events. Clear bumps scan_generation, the worker drops older drops and their batches
+        # are ignored. scans is the number of drops of this generation not finished yet
+        self.scan_requests = queue.Queue()
+        self.scan_events = queue.Queue()
+        self.scan_generation = 0
+        self.scans = 0
+        self.scan_job = None
+        self.scan_worker = None
+
+        # Title Label
+        self.fileLabel = ctk.CTkLabel(self, text = "Select Work Order Files", font = ("Roboto", 20))
+        self.fileLabel.grid(column = 0, columnspan = 4, row = 0, padx = 20, pady = 20, sticky = "nsew")
+
+        # File Display, double click a file to remove it
+        self.displayBox = ctk.CTkTextbox(self, width = 300, height = 200)
+        self.displayBox.grid(column = 0, row = 4, rowspan = 6, columnspan = 4, padx = 20, pady = 20, sticky = "nsew")
+        self.displayBox.bind("<Double-Button-1>", self.removeClicked)
+        self.showEmpty()
+
+        # Inside Upload
+        self.in_frame = inFrame(self)
+        self.in_frame.grid(row = 1, column = 3, rowspan = 3, columnspan = 1, padx = 20, pady = 20, sticky = "nsew")
+
+        # Outside upload
+        self.out_frame = outFrame(self)
+        self.out_frame.grid(row = 1, column = 1, rowspan = 3, columnspan = 1, padx = 20, pady = 20, sticky = "nsew")
+
+        # File count and size
+        self.totalLabel = ctk.CTkLabel(self, text = "")
+        self.totalLabel.grid(column = 0, columnspan = 2, row = 10, padx = 20, pady = 20, sticky = "nsew")
+
+        # Clear Display Box
+        self.clearButton = ctk.CTkButton(self, text = "Clear", command = self.textClear, width = 140, height = 40)
+        self.clearButton.grid(column = 2, columnspan = 2, row = 10, padx = 20, pady = 20, sticky = "nsew")
+
+    def showEmpty(self):
+        '''
+        Sets the file display section to its default text
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        self.displayBox.configure(state = "normal")
+        self.displayBox.delete("0.0", "end")
+        self.displayBox.insert("0.0", "No Files")
+        self.displayBox.configure(state = "disabled")
+
+    def rowText(self, row):
+        '''
+        Gets the line shown for a file
+
+        Args:
+            row (FileRow): The file
+
+        Returns:
+            str: The line without its newline
+        '''
+        text = f"{self.SIDE_LABELS[row.side]}{os.path.basename(row.path)}    {formatSize(row.size)}"
+        if (row.status != "queued"):
+            text = f"{text}    {row.status}"
+        return text
+
+    def updateTotal(self):
+        '''
+        Shows the number of files and their total size under the file display section
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        text = f"{len(self.file_list)} files, {formatSize(self.file_list.size)}" if len(self.file_list) else ""
+        if (self.scans):
+            text = f"{text} (searching)" if text else "Searching"
+        self.totalLabel.configure(text = text)
+
+    def scanFiles(self, paths, side):
+        '''
+        Adds files and everything under folders to the upload. Folders are searched on a worker thread and the files
+        are added a batch at a time, so the window stays usable while a large folder is read.
+
+        Args:
+            paths (list): Files and folders
+            side (str): "inside" or "outside"
+
+        Returns:
+            None
+        '''
+        self.scans += 1
+        self.scan_requests.put((self.scan_generation, list(paths), side))
+        if (not self.scan_worker):
+            self.scan_worker = threading.Thread(target = self.scanWorker, daemon = True)
+            self.scan_worker.start()
+        if (not self.scan_job):
+            self.scan_job = self.after(50, self.pollScan)
+        self.updateTotal()
+
+    def scanWorker(self):
+        '''
+        Searches the dropped files and folders in the order they were dropped and sends the files found in batches of
+        SCAN_BATCH. Runs on its own thread for as long as the window is open and never touches the widgets.
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        while True:
+            generation, paths, side = self.scan_requests.get()
+            if (generation != self.scan_generation):
+                continue
+            batch = []
+            for found in scanPaths(paths):
+                if (generation != self.scan_generation):
+                    break
+                batch.append(found)
+                if (len(batch) >= SCAN_BATCH):
+                    self.scan_events.put((generation, side, batch, False))
+                    batch = []
+            self.scan_events.put((generation, side, batch, True))
+
+    def pollScan(self):
+        '''
+        Adds the batches the worker found to the list, reschedules itself with after() until every search is done
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        self.scan_job = None
+        while True:
+            try:
+                generation, side, batch, done = self.scan_events.get_nowait()
+            except queue.Empty:
+                break
+            if (generation != self.scan_generation):
+                continue
+            if (batch):
+                paths, sizes = zip(*batch)
+                self.addFiles(paths, side, sizes)
+            if (done):
+                self.scans -= 1
+        self.updateTotal()
+        if (self.scans):
+            self.scan_job = self.after(50, self.pollScan)
+
+    def addFiles(self, paths, side, sizes = None):
+        '''
+        Adds files to the upload and appends their lines to the file display section in one insert
+
+        Args:
+            paths (list): The file paths
+            side (str): "inside" or "outside"
+            sizes (list): The size of each path when it is already known
+
+        Returns:
+            list: The FileRows that were added
+        '''
+        first_line = len(self.file_list) + 1
+        rows = self.file_list.add(paths, side, sizes)
+        if (not rows):
+            return rows
+
+        self.displayBox.configure(state = "normal")
+        if (first_line == 1):
+            self.displayBox.delete("0.0", "end")
+        self.displayBox.insert(f"{first_line}.0", "".join(f"{self.rowText(row)}\n" for row in rows))
+        for line, row in enumerate(rows, first_line):
+            mark = f"row{self.next_mark}"
+            self.next_mark += 1
+            self.displayBox.mark_set(mark, f"{line}.0")
+            self.displayBox.mark_gravity(mark, "left")
+            self.marks[row] = mark
+        self.displayBox.configure(state = "disabled")
+        self.updateTotal()
+        return rows
+
+    def removeRow(self, row):
+        '''
+        Takes one file out of the upload and its line out of the file display section
+
+        Args:
+            row (FileRow): The file to remove
+
+        Returns:
+            None
+        '''
+        self.file_list.remove(row)
+        self.updateTotal()
+        mark = self.marks.pop(row)
+        if (not len(self.file_list)):
+            self.displayBox.mark_unset(mark)
+            self.showEmpty()
+            return
+
+        self.displayBox.configure(state = "normal")
+        self.displayBox.delete(mark, f"{mark} + 1 lines")
+        self.displayBox.mark_unset(mark)
+        self.displayBox.configure(state = "disabled")
+
+    def removeClicked(self, event):
+        '''
+        Removes the file that was double clicked
+
+        Args:
+            event (object): The click event
+
+        Returns:
+            str: "break" so the click does not also select text
+        '''
+        line = int(self.displayBox.index(f"@{event.x},{event.y}").split(".")[0])
+        if (1 <= line <= len(self.file_list)):
+            self.removeRow(self.file_list.rows[line - 1])
+        return "break"
+
+    def setStatus(self, path, status):
+        '''
+        Shows a new upload status on the lines of a file
+
+        Args:
+            path (str): The file path
+            status (str): "queued", "copied" or "failed"
+
+        Returns:
+            None
+        '''
+        rows = self.file_list.setStatus(path, status)
+        if (not rows):
+            return
+        self.displayBox.configure(state = "normal")
+        for row in rows:
+            mark = self.marks[row]
+            self.displayBox.delete(mark, f"{mark} lineend")
+            self.displayBox.insert(mark, self.rowText(row))
+        self.displayBox.configure(state = "disabled")
+
+    def textClear(self):
+        '''
+        Clears the text on the file display section and sets it to default
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        if (self.marks):
+            self.displayBox.mark_unset(*self.marks.values())
+        self.marks = {}
+        # Stops any folder that is still being searched
+        self.scan_generation += 1
+        self.scans = 0
+        if (self.scan_job):
+            self.after_cancel(self.scan_job)
+            self.scan_job = None
+        self.file_list.clear()
+        self.showEmpty()
+        self.updateTotal()
+
+class inFrame(ctk.CTkFrame):
+    '''
+    Sub class for the File input and display section
+
+    Args:
+        ctk.CTkFrame: The parent class for the frame
+
+    Returns:
+        None
+    '''
+    def __init__(self, master, *args, **kwargs):
+        super().__init__(master, *args, **kwargs)
+
+        self.file_frame = master
+        self.currentFile = None
+
+        # Label
+        self.insideLabel = ctk.CTkLabel(self, text = "Inside")
+        self.insideLabel.grid(column = 0, row = 0, padx = 20, pady = 10)
+
+        # Drag and drop
+        self.dropinEntry = ctk.CTkEntry(self, placeholder_text = "Drop File", height = 40, state = "disabled")
+        self.dropinEntry.grid(column = 0, row = 1, padx = 20, pady = 20)
+        self.dropinEntry.drop_target_register(DND_FILES)
+        self.dropinEntry.dnd_bind("<<Drop>>", self.dropFile)
+        
+        # Out Button
+        self.inButton = ctk.CTkButton(self, height = 40, text = "Upload File", command = self.openFile)
+        self.inButton.grid(column = 0, row = 2, padx = 20, pady = 20)
+
+    @property
+    def paths(self):
+        return self.file_frame.file_list.paths("inside")
+
+    def dropFile(self, event):
+        '''
+        Gets the dropped files, dropped folders are searched for files
+
+        Args:
+            event (object): The event triggered by the drop in option
+        
+        Returns:
+            None
+        '''
+        # Tk sends a list of paths, paths with spaces are wrapped in braces
+        paths = self.tk.splitlist(event.data)
+        if (paths):
+            self.currentFile = os.path.basename(paths[-1])
+        self.file_frame.scanFiles(paths, "inside")
+
+    def openFile(self):
+        '''
+        Gets the files from the file explorer input option
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        paths = filedialog.askopenfilenames()
+        if (paths):
+            self.currentFile = os.path.basename(paths[-1])
+        self.file_frame.addFiles(paths, "inside")
+
+class outFrame(ctk.CTkFrame):
+    def __init__(self, master, *args, **kwargs):
+        super().__init__(master, *args, **kwargs)
+
+        self.file_frame = master
+        self.currentFile = None
+
+        # Label
+        self.outLabel = ctk.CTkLabel(self, text = "Outside")
+        self.outLabel.grid(column = 0, row = 0, padx = 20, pady = 10)
+
+        # Drag and drop
+        self.dropOutEntry = ctk.CTkEntry(self, placeholder_text = "Drop File", height = 40, state = "disabled")
+        self.dropOutEntry.grid(column = 0, row = 2, padx = 20, pady = 20)
+        self.dropOutEntry.drop_target_register(DND_FILES)
+        self.dropOutEntry.dnd_bind("<<Drop>>", self.dropFile)
+        
+        # Out Button
+        self.outButton = ctk.CTkButton(self, height = 40, text = "Upload File", command = self.openFile)
+        self.outButton.grid(column = 0, row = 3, padx = 20, pady = 20)
+
+    @property
+    def paths(self):
+        return self.file_frame.file_list.paths("outside")
+
+    def dropFile(self, event):
+        '''
+        Gets the dropped files, dropped folders are searched for files
+
+        Args:
+            event (object): The event triggered by the drop in option
+        
+        Returns:
+            None
+        '''
+        # Tk sends a list of paths, paths with spaces are wrapped in braces
+        paths = self.tk.splitlist(event.data)
+        if (paths):
+            self.currentFile = os.path.basename(paths[-1])
+        self.file_frame.scanFiles(paths, "outside")
+
+    def openFile(self):
+        '''
+        Gets the files from the file explorer input option
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        paths = filedialog.askopenfilenames()
+        if (paths):
+            self.currentFile = os.path.basename(paths[-1])
+        self.file_frame.addFiles(paths, "outside")
\ No newline at end of file